@@ -0,0 +1,148 @@
+"""Benchmark: per-request cost of spending a pro credit.
+
+Compares the old SELECT / UPDATE / COMMIT / SELECT sequence with the atomic
+single-statement debit in ``services.credits``, then races threads against
+one token to check that no path over-spends.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_credit_debit [--ops 5000] [--threads 8] [--no-returning]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import services.credits as credits
+
+
+def _legacy_debit(conn: sqlite3.Connection, th: str):
+    """The pre-atomic enforce_limits sequence (four round trips)."""
+    row = conn.execute(
+        "SELECT credits_left FROM pro_tokens WHERE token_hash = ?", (th,)
+    ).fetchone()
+    if not row:
+        return None
+    if int(row[0]) <= 0:
+        return -1
+    conn.execute(
+        "UPDATE pro_tokens SET credits_left = credits_left - 1 WHERE token_hash = ?",
+        (th,),
+    )
+    conn.commit()
+    row = conn.execute(
+        "SELECT credits_left FROM pro_tokens WHERE token_hash = ?", (th,)
+    ).fetchone()
+    return int(row[0])
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def _setup(path: str, balance: int) -> None:
+    conn = _connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pro_tokens ("
+        "token_hash TEXT PRIMARY KEY, credits_left INTEGER NOT NULL, created_at INTEGER NOT NULL)"
+    )
+    conn.execute("DELETE FROM pro_tokens")
+    conn.execute("INSERT INTO pro_tokens VALUES ('th', ?, 0)", (balance,))
+    conn.commit()
+    conn.close()
+
+
+def _count_statements(conn: sqlite3.Connection, fn) -> int:
+    statements = []
+    conn.set_trace_callback(statements.append)
+    fn(conn, "th")
+    conn.set_trace_callback(None)
+    return len(statements)
+
+
+def bench_serial(path: str, fn, ops: int) -> float:
+    _setup(path, ops + 1)
+    conn = _connect(path)
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn(conn, "th")
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed / ops * 1e6
+
+
+def race(path: str, fn, threads: int, balance: int, attempts_per_thread: int) -> tuple:
+    """Return (successful debits, final balance)."""
+    _setup(path, balance)
+    successes = [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(i: int) -> None:
+        conn = _connect(path)
+        barrier.wait()
+        for _ in range(attempts_per_thread):
+            try:
+                left = fn(conn, "th")
+            except sqlite3.OperationalError:
+                conn.rollback()
+                continue
+            if left is not None and left >= 0:
+                successes[i] += 1
+        conn.close()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    conn = _connect(path)
+    final = conn.execute("SELECT credits_left FROM pro_tokens").fetchone()[0]
+    conn.close()
+    return sum(successes), final
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--no-returning", action="store_true",
+                        help="force the pre-3.35 fallback path")
+    args = parser.parse_args()
+
+    if args.no_returning:
+        credits.HAS_RETURNING = False
+    print(f"SQLite {sqlite3.sqlite_version}, RETURNING used: {credits.HAS_RETURNING}")
+
+    paths = {
+        "legacy (4 statements)": _legacy_debit,
+        "atomic": credits.debit_credit_sync,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"\n{'path':<24}{'stmts/req':>10}{'us/req':>10}")
+        for name, fn in paths.items():
+            _setup(path, 10)
+            conn = _connect(path)
+            stmts = _count_statements(conn, fn)
+            conn.close()
+            us = bench_serial(path, fn, args.ops)
+            print(f"{name:<24}{stmts:>10}{us:>10.1f}")
+
+        balance = args.threads * 25
+        attempts = 50  # twice the balance in total, so the token runs dry
+        print(f"\nRace: {args.threads} threads x {attempts} debits against {balance} credits")
+        for name, fn in paths.items():
+            ok, final = race(path, fn, args.threads, balance, attempts)
+            verdict = "OK" if ok == balance and final == 0 else "OVERSPENT/WRONG"
+            print(f"{name:<24} granted={ok:<6} final_balance={final:<6} {verdict}")
+
+
+if __name__ == "__main__":
+    main()
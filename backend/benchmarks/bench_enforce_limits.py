@@ -0,0 +1,177 @@
+"""Benchmark: per-request overhead of ``middleware.auth.enforce_limits``.
+
+Runs the whole auth path in-process, with Redis replaced by a stub that
+answers EVALSHA immediately and SQLite by an in-memory database called
+inline, so the numbers are the Python work done per request: header
+parsing, IP hashing, the local limiter, key building and the credit debit.
+
+Scenarios:
+
+- ``ip hash (legacy)`` / ``ip hash (keyed)``: the rotating IP hash alone,
+  before and after ``WindowKeyedHasher``;
+- ``free``: a request without a pro token;
+- ``pro``: a request that spends a pro credit;
+- ``flooded``: a request rejected by the local flood filter (429);
+- ``redis down``: a request served by the per-process fallback limiter.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_enforce_limits [--ops 20000] [--algorithm fixed]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import sqlite3
+import time
+
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError
+from starlette.requests import Request
+
+import middleware.auth as auth
+import services.credits as credits
+from config.settings import settings
+from state.redis_state import set_redis
+from utils.crypto_utils import hash_token, window_hasher
+
+PRO_TOKEN = "bench-pro-token"
+
+
+class StubRedis:
+    """Answers every EVALSHA with 'plenty left' without any I/O."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+
+    async def evalsha(self, sha, numkeys, *keys_and_args):
+        if self.fail:
+            raise RedisConnectionError("stub: Redis down")
+        return [settings.rl_max_requests_ip - 1, settings.rl_window_seconds]
+
+    async def script_load(self, source):
+        return hashlib.sha1(source.encode()).hexdigest()
+
+
+def _legacy_rotating_ip_hash(raw_ip: str, window_id: int) -> str:
+    """The pre-WindowKeyedHasher implementation (two SHA-256 per call)."""
+    window_salt = hashlib.sha256(
+        f"{settings.server_salt}:{window_id}".encode()
+    ).hexdigest()
+    return hashlib.sha256(f"{window_salt}:{raw_ip}".encode()).hexdigest()
+
+
+def _request(ip: str, pro: bool) -> Request:
+    headers = [
+        (b"x-void-client-id", b"bench-client-0001"),
+        (b"x-void-browser-fp", b"bench-fingerprint-0001"),
+        (b"x-forwarded-for", ip.encode()),
+    ]
+    if pro:
+        headers.append((b"x-void-pro-token", PRO_TOKEN.encode()))
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/chat/stream",
+        "headers": headers,
+        "client": ("127.0.0.1", 40000),
+    }
+    return Request(scope)
+
+
+def _stub_sqlite(balance: int) -> None:
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE pro_tokens (token_hash TEXT PRIMARY KEY, "
+        "credits_left INTEGER NOT NULL, created_at INTEGER NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO pro_tokens VALUES (?, ?, 0)", (hash_token(PRO_TOKEN), balance)
+    )
+    conn.commit()
+
+    async def run_db_inline(fn, *args):
+        return fn(conn, *args)
+
+    credits.run_db = run_db_inline
+
+
+def bench_hash(fn, ops: int) -> float:
+    window_id = int(time.time() // settings.rl_window_seconds)
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(f"10.0.{i % 250}.{i % 7}", window_id)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+async def bench_requests(ops: int, pro: bool, expect: int = 200) -> float:
+    requests = [_request(f"10.1.{i % 250}.{i // 250 % 250}", pro) for i in range(ops)]
+    start = time.perf_counter()
+    for req in requests:
+        try:
+            await auth.enforce_limits(req)
+            status = 200
+        except HTTPException as e:
+            status = e.status_code
+        if status != expect:
+            raise SystemExit(f"unexpected status {status} (wanted {expect})")
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def _reset_limiters() -> None:
+    auth.flood_limiter._buckets.clear()
+    auth.fallback_limiter._buckets.clear()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--algorithm", default="fixed",
+                        choices=["fixed", "sliding", "token_bucket"])
+    args = parser.parse_args()
+
+    settings.payments_enabled = True
+    settings.rl_algorithm = args.algorithm
+    settings.credit_ledger_redis = False
+    _stub_sqlite(balance=args.ops * 4)
+
+    results = [
+        ("ip hash (legacy)", bench_hash(_legacy_rotating_ip_hash, args.ops)),
+        ("ip hash (keyed)", bench_hash(lambda ip, w: window_hasher.hash(ip.encode(), w), args.ops)),
+    ]
+
+    set_redis(StubRedis())
+    _reset_limiters()
+    results.append(("free", await bench_requests(args.ops, pro=False)))
+    _reset_limiters()
+    results.append(("pro", await bench_requests(args.ops, pro=True)))
+
+    # Every request from one IP: after the burst allowance, the flood
+    # filter answers 429 without reaching Redis.
+    _reset_limiters()
+    flood_req = _request("10.2.0.1", pro=False)
+    allowance = int(settings.rl_max_requests_ip * settings.rl_local_burst_factor)
+    for _ in range(allowance):
+        await auth.enforce_limits(flood_req)
+    start = time.perf_counter()
+    for _ in range(args.ops):
+        try:
+            await auth.enforce_limits(flood_req)
+        except HTTPException:
+            pass
+    results.append(("flooded", (time.perf_counter() - start) / args.ops * 1e6))
+
+    set_redis(StubRedis(fail=True))
+    _reset_limiters()
+    results.append(("redis down", await bench_requests(args.ops, pro=False)))
+    set_redis(None)
+
+    print(f"RL_ALGORITHM={args.algorithm}, {args.ops} ops per scenario\n")
+    print(f"{'scenario':<20}{'us/op':>10}{'ops/s':>12}")
+    for name, us in results:
+        print(f"{name:<20}{us:>10.2f}{1e6 / us:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
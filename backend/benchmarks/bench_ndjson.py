@@ -0,0 +1,137 @@
+"""Benchmark: parsing an Ollama chat stream into content bytes.
+
+Compares the old path (``aiter_lines`` → ``json.loads`` → ``.encode()``)
+with ``utils.ndjson`` on ``aiter_bytes`` for every JSON backend installed.
+The stream is a realistic Ollama reply (ASCII, non-ASCII and escaped
+tokens, a final ``done`` object with stats) cut into chunks at random
+byte offsets, so lines and multi-byte characters are split across reads.
+Each path's output is checked against the expected text.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ndjson [--tokens 2000] [--streams 50] [--chunk 512]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from utils import ndjson
+
+WORDS = ["the", " model", " says", " héllo", " wörld", " 🚀", ' "quoted"', "\n\n", " tab\tbed", " ok"]
+
+
+class _ChunkStream(httpx.AsyncByteStream):
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def make_stream(tokens: int, chunk: int, seed: int = 0):
+    """Return (chunks, expected content bytes)."""
+    rnd = random.Random(seed)
+    lines, expected = [], []
+    for _ in range(tokens):
+        word = rnd.choice(WORDS)
+        expected.append(word)
+        lines.append(json.dumps({
+            "model": "llama3.1:8b",
+            "created_at": "2026-01-01T00:00:00.000000Z",
+            "message": {"role": "assistant", "content": word},
+            "done": False,
+        }, ensure_ascii=rnd.random() < 0.3))
+    lines.append(json.dumps({
+        "model": "llama3.1:8b",
+        "created_at": "2026-01-01T00:00:00.000000Z",
+        "message": {"role": "assistant", "content": ""},
+        "done_reason": "stop",
+        "done": True,
+        "total_duration": 123456789,
+        "load_duration": 1234567,
+        "prompt_eval_count": 26,
+        "eval_count": tokens,
+        "eval_duration": 98765432,
+    }))
+    body = ("\n".join(lines) + "\n").encode()
+    chunks, pos = [], 0
+    while pos < len(body):
+        step = rnd.randint(1, chunk * 2)
+        chunks.append(body[pos:pos + step])
+        pos += step
+    return chunks, "".join(expected).encode()
+
+
+async def legacy(response: httpx.Response) -> bytes:
+    out = []
+    async for line in response.aiter_lines():
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+            chunk = (obj.get("message") or {}).get("content") or ""
+            if chunk:
+                out.append(chunk.encode("utf-8"))
+        except json.JSONDecodeError:
+            continue
+    return b"".join(out)
+
+
+def byte_path(parse):
+    async def run(response: httpx.Response) -> bytes:
+        out = []
+        lines = ndjson.LineSplitter()
+        async for data in response.aiter_bytes():
+            for line in lines.feed(data):
+                parsed = parse(line) if line else None
+                if parsed is not None and parsed[0]:
+                    out.append(parsed[0])
+        tail = lines.flush()
+        parsed = parse(tail) if tail else None
+        if parsed is not None and parsed[0]:
+            out.append(parsed[0])
+        return b"".join(out)
+
+    return run
+
+
+async def bench(fn, chunks, expected: bytes, streams: int) -> float:
+    start = time.perf_counter()
+    for _ in range(streams):
+        out = await fn(httpx.Response(200, stream=_ChunkStream(chunks)))
+        if out != expected:
+            raise SystemExit(f"{fn.__name__}: output mismatch")
+    return time.perf_counter() - start
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--chunk", type=int, default=512, help="average read size in bytes")
+    args = parser.parse_args()
+
+    chunks, expected = make_stream(args.tokens, args.chunk)
+    paths = {"aiter_lines + json (old)": legacy}
+    for backend in ndjson.BACKENDS:
+        paths[f"aiter_bytes + {backend}"] = byte_path(ndjson.make_chat_line_parser(backend))
+
+    total = args.tokens * args.streams
+    print(f"{args.streams} streams x {args.tokens} tokens, {len(chunks)} reads per stream\n")
+    print(f"{'path':<28}{'us/token':>10}{'tokens/s':>14}")
+    baseline = None
+    for name, fn in paths.items():
+        elapsed = await bench(fn, chunks, expected, args.streams)
+        baseline = baseline or elapsed
+        print(f"{name:<28}{elapsed / total * 1e6:>10.2f}{total / elapsed:>14,.0f}"
+              f"   x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Benchmark: rate-limit algorithms — Redis cost per request and burst accuracy.
+
+For each RL_ALGORITHM (plus the old EVAL-with-full-text fixed window) this
+reports round trips, request bytes and server-side Redis commands per
+request, latency, and how many requests get through a burst that straddles a
+window edge (ideal: at most the limit in any window-length interval).
+
+Needs a Redis server (REDIS_URL), or ``--fake`` to use fakeredis (no
+command stats). Run from the backend directory:
+
+    python -m benchmarks.bench_rate_limit [--requests 2000] [--limit 20] [--window 2] [--fake]
+"""
+
+import argparse
+import asyncio
+import time
+
+from redis.asyncio import Redis
+
+from config.settings import settings
+from middleware import rate_limit
+from utils.crypto_utils import window_hasher
+
+
+def _keys(prefix: str, windows: int, raw_ip: str, now: float):
+    window_id = int(now // settings.rl_window_seconds)
+    return [
+        f"{prefix}:{window_hasher.hash(raw_ip.encode(), w)}:{w}"
+        for w in range(window_id, window_id - windows, -1)
+    ]
+
+
+async def _hit(redis: Redis, mode: str, raw_ip: str) -> int:
+    now = time.time()
+    if mode == "fixed (legacy EVAL)":
+        keys = _keys("rl", 1, raw_ip, now)
+        res = await redis.eval(
+            rate_limit.RL_LUA, 1, keys[0], settings.rl_max_requests_ip, settings.rl_window_seconds
+        )
+        return int(res[0])
+    settings.rl_algorithm = mode
+    _, prefix, windows = rate_limit.algorithm()
+    remaining, _ = await rate_limit.check_rate_limit(
+        redis, _keys(prefix, windows, raw_ip, now), f"{now:.6f}:{time.perf_counter_ns()}"
+    )
+    return remaining
+
+
+async def _commandstats(redis: Redis):
+    try:
+        stats = await redis.info("commandstats")
+    except Exception:
+        return None
+    return sum(v["calls"] for k, v in stats.items() if not k.startswith("cmdstat_info"))
+
+
+def _request_bytes(mode: str) -> int:
+    """Approximate payload bytes for the script part of the command."""
+    if mode == "fixed (legacy EVAL)":
+        return len(rate_limit.RL_LUA.encode())
+    return 40  # SHA1 hex digest
+
+
+async def bench_cost(redis: Redis, mode: str, requests: int) -> dict:
+    before = await _commandstats(redis)
+    start = time.perf_counter()
+    for i in range(requests):
+        await _hit(redis, mode, f"10.0.{i // 250}.{i % 250}")
+    elapsed = time.perf_counter() - start
+    after = await _commandstats(redis)
+    cmds = (after - before) / requests if before is not None and after is not None else None
+    return {"us": elapsed / requests * 1e6, "cmds": cmds, "bytes": _request_bytes(mode)}
+
+
+async def bench_burst(redis: Redis, mode: str, burst: int) -> int:
+    """Fire ``burst`` requests just before a window edge and again just after.
+
+    Returns how many were allowed within that ~0.1s span.
+    """
+    window = settings.rl_window_seconds
+    raw_ip = f"192.0.2.{int(time.time()) % 250}"
+    edge = (time.time() // window + 1) * window
+    await asyncio.sleep(max(0.0, edge - 0.05 - time.time()))
+    allowed = 0
+    for _ in range(burst):
+        allowed += await _hit(redis, mode, raw_ip) >= 0
+    await asyncio.sleep(max(0.0, edge + 0.05 - time.time()))
+    for _ in range(burst):
+        allowed += await _hit(redis, mode, raw_ip) >= 0
+    return allowed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--window", type=int, default=2)
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of REDIS_URL")
+    args = parser.parse_args()
+
+    settings.rl_max_requests_ip = args.limit
+    settings.rl_window_seconds = args.window
+    if args.fake:
+        import fakeredis
+
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        redis = Redis.from_url(settings.redis_url, decode_responses=True)
+
+    modes = ["fixed (legacy EVAL)", "fixed", "sliding", "token_bucket"]
+    print(f"limit={args.limit} per {args.window}s, {args.requests} requests per mode\n")
+    print(f"{'mode':<22}{'trips':>6}{'script bytes':>14}{'redis cmds':>12}{'us/req':>9}{'burst allowed':>15}")
+    for mode in modes:
+        await redis.flushdb()
+        cost = await bench_cost(redis, mode, args.requests)
+        allowed = await bench_burst(redis, mode, args.limit * 2)
+        cmds = f"{cost['cmds']:.1f}" if cost["cmds"] is not None else "n/a"
+        print(
+            f"{mode:<22}{1:>6}{cost['bytes']:>14}{cmds:>12}{cost['us']:>9.0f}"
+            f"{allowed:>9} / {args.limit}"
+        )
+    await redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
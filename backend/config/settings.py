@@ -9,22 +9,115 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _model_map(raw: str, cast=int) -> dict:
+    """Parse "model=value,model=value" into a dict of model name -> cast(value)."""
+    result = {}
+    for item in raw.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip() and value.strip():
+            result[name.strip()] = cast(value.strip())
+    return result
+
+
 class Settings:
     """Application settings loaded from environment variables."""
 
     # Ollama — loaded from env at startup, overridable at runtime via POST /configure/ai-url
-    _ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    # OLLAMA_BASE_URLS (comma-separated) configures a pool of backends;
+    # when unset, OLLAMA_BASE_URL is the only backend.
+    _ollama_base_urls: list = [
+        u.strip() for u in os.getenv("OLLAMA_BASE_URLS", "").split(",") if u.strip()
+    ] or [os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")]
     ollama_model: str = os.getenv("OLLAMA_MODEL", "")
 
     @property
     def ollama_base_url(self) -> str:
-        return self._ollama_base_url
+        """Primary backend URL (the first one in the pool)."""
+        return self._ollama_base_urls[0]
+
+    @property
+    def ollama_base_urls(self) -> list[str]:
+        return list(self._ollama_base_urls)
 
     def set_ollama_base_url(self, url: str) -> None:
-        """Override Ollama URL at runtime (self-hosted mode only)."""
+        """Override Ollama URL at runtime (self-hosted mode only).
+
+        Replaces the whole backend pool with this single URL.
+        """
         url = url.strip()
         if url.startswith("http://") or url.startswith("https://"):
-            self._ollama_base_url = url
+            self._ollama_base_urls = [url]
+
+    # GET /models cache: fresh for TTL seconds, then served stale (while
+    # refreshing in the background) for up to STALE seconds
+    models_cache_ttl: float = float(os.getenv("MODELS_CACHE_TTL", "30"))
+    models_cache_stale: float = float(os.getenv("MODELS_CACHE_STALE", "600"))
+
+    # Backend pool health checks and routing
+    ollama_health_interval: float = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+    ollama_health_timeout: float = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "3"))
+    ollama_eject_after_failures: int = int(os.getenv("OLLAMA_EJECT_AFTER_FAILURES", "2"))
+    # Extra "in-flight requests" a node is charged when the model is not loaded
+    # there yet — how much busier a warm node may be before a cold one wins.
+    ollama_cold_load_penalty: int = int(os.getenv("OLLAMA_COLD_LOAD_PENALTY", "4"))
+    # Keep a client's requests on the backend that served it last, so Ollama
+    # can reuse the KV cache of the shared conversation prefix.
+    ollama_affinity: bool = os.getenv("OLLAMA_AFFINITY", "1") == "1"
+    ollama_affinity_ttl: float = float(os.getenv("OLLAMA_AFFINITY_TTL", "600"))
+    ollama_affinity_size: int = int(os.getenv("OLLAMA_AFFINITY_SIZE", "100000"))
+
+    # How long Ollama keeps a model loaded after a request, and its context
+    # size (0 = Ollama's default). Per-model overrides as "model=value,...".
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "5m")
+    ollama_keep_alive_by_model: dict = _model_map(os.getenv("OLLAMA_KEEP_ALIVE_BY_MODEL", ""), str)
+    ollama_num_ctx: int = int(os.getenv("OLLAMA_NUM_CTX", "0"))
+    ollama_num_ctx_by_model: dict = _model_map(os.getenv("OLLAMA_NUM_CTX_BY_MODEL", ""))
+
+    # Model warm-up (see services/warmup.py). WARMUP_MODELS defaults to
+    # OLLAMA_MODEL; WARMUP_INTERVAL=0 turns the keep-warm scheduler off.
+    warmup_models: list = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+    warmup_on_start: bool = os.getenv("WARMUP_ON_START", "1") == "1"
+    warmup_interval: float = float(os.getenv("WARMUP_INTERVAL", "60"))
+    # A model is hot with WARMUP_MIN_REQUESTS chats in the last WARMUP_WINDOW seconds
+    warmup_window: float = float(os.getenv("WARMUP_WINDOW", "600"))
+    warmup_min_requests: int = int(os.getenv("WARMUP_MIN_REQUESTS", "3"))
+    # A chat whose model load took at least this long counts as a cold start
+    warmup_cold_ms: float = float(os.getenv("WARMUP_COLD_MS", "500"))
+
+    # Admission control in front of /chat/stream (see services/admission.py).
+    # Match OLLAMA_MAX_CONCURRENCY_PER_BACKEND to Ollama's OLLAMA_NUM_PARALLEL.
+    ollama_max_concurrency_per_backend: int = int(os.getenv("OLLAMA_MAX_CONCURRENCY_PER_BACKEND", "4"))
+    admission_queue_max: int = int(os.getenv("ADMISSION_QUEUE_MAX", "64"))
+    admission_queue_timeout: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+    # Pro requests admitted per free request while both are waiting
+    admission_pro_weight: int = int(os.getenv("ADMISSION_PRO_WEIGHT", "4"))
+
+    # How often an open chat stream checks whether its client is still there
+    disconnect_poll_ms: float = float(os.getenv("DISCONNECT_POLL_MS", "250"))
+
+    # Coalescing of streamed chat tokens into fewer writes (see utils/streaming.py).
+    # 0/0 streams every token as its own chunk. Requests may pick their own
+    # values with coalesce_bytes / coalesce_ms, capped by the *_MAX settings.
+    stream_coalesce_bytes: int = int(os.getenv("STREAM_COALESCE_BYTES", "0"))
+    stream_coalesce_ms: float = float(os.getenv("STREAM_COALESCE_MS", "0"))
+    stream_coalesce_max_bytes: int = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "16384"))
+    stream_coalesce_max_ms: float = float(os.getenv("STREAM_COALESCE_MAX_MS", "250"))
+
+    # Admin endpoints (/metrics). Required in payment mode; open in self-hosted mode.
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
+
+    # Ollama upstream connection pool — one long-lived keep-alive client shared
+    # by all chat streams and model listings (see services/ollama.py).
+    ollama_max_connections: int = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "200"))
+    ollama_max_connections_per_host: int = int(os.getenv("OLLAMA_MAX_CONNECTIONS_PER_HOST", "64"))
+    ollama_max_keepalive: int = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "32"))
+    ollama_keepalive_expiry: float = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+    ollama_connect_timeout: float = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+    # Max seconds without a byte from Ollama (covers model load + first token)
+    ollama_read_timeout: float = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+    # HTTP/2 is negotiated via ALPN, so it only takes effect on https:// backends
+    # that support it. Plain http:// Ollama keeps using HTTP/1.1 keep-alive.
+    ollama_http2: bool = os.getenv("OLLAMA_HTTP2", "1") == "1"
 
     # Security — HMAC salt for fingerprint hashing
     server_salt: str = os.getenv("SERVER_SALT", "change_this_to_a_random_string_in_production")
@@ -32,9 +125,61 @@ class Settings:
     # Rate Limiting (only when payments_enabled=True)
     rl_window_seconds: int = int(os.getenv("RL_WINDOW_SECONDS", "60"))
     rl_max_requests_ip: int = int(os.getenv("RL_MAX_REQUESTS_IP", "30"))
+    # "fixed", "sliding" or "token_bucket" (see middleware/rate_limit.py)
+    rl_algorithm: str = os.getenv("RL_ALGORITHM", "fixed").lower()
+    # Per-process first tier: rejects clients far above the limit without a
+    # Redis round trip. Looser than the shared limit because each worker only
+    # sees part of the traffic. The same table backs the fallback when Redis is down.
+    rl_local_enabled: bool = os.getenv("RL_LOCAL_ENABLED", "1") == "1"
+    rl_local_burst_factor: float = float(os.getenv("RL_LOCAL_BURST_FACTOR", "2"))
+    rl_local_max_entries: int = int(os.getenv("RL_LOCAL_MAX_ENTRIES", "100000"))
 
     # Redis (only required when payments_enabled=True)
     redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Seconds before a Redis call is treated as failed (local fallbacks kick in)
+    redis_timeout: float = float(os.getenv("REDIS_TIMEOUT", "1"))
+
+    # Keep pro-token balances in Redis and write them through to SQLite every
+    # CREDIT_FLUSH_INTERVAL seconds (see services/credit_ledger.py).
+    # Run Redis with AOF persistence when enabling this.
+    credit_ledger_redis: bool = os.getenv("CREDIT_LEDGER_REDIS", "0") == "1"
+    credit_flush_interval: float = float(os.getenv("CREDIT_FLUSH_INTERVAL", "5"))
+
+    # In-process pro-token lookup cache (entries, seconds). Unknown tokens are
+    # cached separately so guessing attacks don't evict real ones.
+    token_cache_size: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    token_cache_ttl: float = float(os.getenv("TOKEN_CACHE_TTL", "10"))
+    token_invalid_cache_size: int = int(os.getenv("TOKEN_INVALID_CACHE_SIZE", "10000"))
+    token_invalid_cache_ttl: float = float(os.getenv("TOKEN_INVALID_CACHE_TTL", "300"))
+
+    # Identical /chat/stream requests in flight at the same time share one
+    # generation (see services/broadcast.py).
+    chat_dedup_inflight: bool = os.getenv("CHAT_DEDUP_INFLIGHT", "1") == "1"
+
+    # Exact-match response cache for /chat/stream (see services/response_cache.py).
+    # Only useful for deterministic traffic; off by default.
+    response_cache_enabled: bool = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+    response_cache_ttl: float = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    response_cache_local_size: int = int(os.getenv("RESPONSE_CACHE_LOCAL_SIZE", "256"))
+    response_cache_max_bytes: int = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", "65536"))
+
+    # Context window (see services/context.py). Token budgets per model as
+    # "model=tokens,..."; CONTEXT_MAX_TOKENS applies to the rest. When neither
+    # is set, the model's num_ctx is used (0 everywhere = no trimming).
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+    context_max_tokens_by_model: dict = _model_map(os.getenv("CONTEXT_MAX_TOKENS_BY_MODEL", ""))
+    # Left free for the reply
+    context_reserve_tokens: int = int(os.getenv("CONTEXT_RESERVE_TOKENS", "1024"))
+    context_token_cache_size: int = int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "8192"))
+    # Trim down to this fraction of the budget, so the kept history stays the
+    # same for the next few turns instead of shifting every turn
+    context_trim_to: float = float(os.getenv("CONTEXT_TRIM_TO", "0.75"))
+    # Rolling summary of trimmed turns, made in the background
+    context_summary: bool = os.getenv("CONTEXT_SUMMARY", "0") == "1"
+    context_summary_model: str = os.getenv("CONTEXT_SUMMARY_MODEL", "")
+    context_summary_max_tokens: int = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "256"))
+    context_summary_cache_size: int = int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "1024"))
+    context_summary_ttl: float = float(os.getenv("CONTEXT_SUMMARY_TTL", "3600"))
 
     # Dev endpoints
     dev_reset_enabled: bool = os.getenv("DEV_RESET_ENABLED", "0") == "1"
@@ -52,6 +197,39 @@ class Settings:
     btcpay_api_key: str = os.getenv("BTCPAY_API_KEY", "")
     btcpay_webhook_secret: str = os.getenv("BTCPAY_WEBHOOK_SECRET", "")
 
+    # Payment gateway calls (see services/gateway.py): one shared connection
+    # pool, per-endpoint timeouts in seconds, retries with jittered backoff on
+    # idempotent calls, and a circuit breaker per gateway
+    gateway_max_connections: int = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "20"))
+    gateway_timeout_quote: float = float(os.getenv("GATEWAY_TIMEOUT_QUOTE", "5"))
+    gateway_timeout_status: float = float(os.getenv("GATEWAY_TIMEOUT_STATUS", "10"))
+    gateway_timeout_create: float = float(os.getenv("GATEWAY_TIMEOUT_CREATE", "20"))
+    gateway_retries: int = int(os.getenv("GATEWAY_RETRIES", "2"))
+    gateway_retry_backoff_ms: float = float(os.getenv("GATEWAY_RETRY_BACKOFF_MS", "200"))
+    gateway_breaker_failures: int = int(os.getenv("GATEWAY_BREAKER_FAILURES", "5"))
+    gateway_breaker_reset: float = float(os.getenv("GATEWAY_BREAKER_RESET", "30"))
+
+    # Payment webhooks are stored and answered at once, then applied by
+    # background workers (see services/webhook_inbox.py)
+    webhook_workers: int = int(os.getenv("WEBHOOK_WORKERS", "2"))
+    webhook_batch_size: int = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+    webhook_poll_interval: float = float(os.getenv("WEBHOOK_POLL_INTERVAL", "2"))
+    webhook_max_attempts: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+    # Seconds before a claimed but unfinished event is retried
+    webhook_claim_timeout: int = int(os.getenv("WEBHOOK_CLAIM_TIMEOUT", "120"))
+    webhook_retention_days: int = int(os.getenv("WEBHOOK_RETENTION_DAYS", "30"))
+
+    # GET /pro/payment-events: keep-alive comment every HEARTBEAT seconds;
+    # the stream ends after TIMEOUT seconds and the browser reconnects
+    payment_events_heartbeat: float = float(os.getenv("PAYMENT_EVENTS_HEARTBEAT", "15"))
+    payment_events_timeout: float = float(os.getenv("PAYMENT_EVENTS_TIMEOUT", "300"))
+
+    # GET /get-prices cache: fresh for TTL seconds, then served flagged stale
+    # while refreshing; after MAX_STALE callers wait up to FETCH_TIMEOUT seconds
+    price_cache_ttl: float = float(os.getenv("PRICE_CACHE_TTL", "60"))
+    price_cache_max_stale: float = float(os.getenv("PRICE_CACHE_MAX_STALE", "1800"))
+    price_fetch_timeout: float = float(os.getenv("PRICE_FETCH_TIMEOUT", "3"))
+
     # Pro Plans — read from env (PLAN_1, PLAN_2, PLAN_3).
     # BTC minimum on NOWPayments is ~$10. Lower amounts will fail.
     @property
@@ -74,6 +252,13 @@ class Settings:
 
     # Database
     db_path: str = os.getenv("DB_PATH", "void.db")
+    # Pooled connections / worker threads for SQLite access off the event loop
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "4"))
+    # NORMAL is durable across app crashes in WAL mode; FULL also survives power loss
+    db_synchronous: str = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+    db_cache_size_kb: int = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+    # Prepared statements kept per connection
+    db_statement_cache: int = int(os.getenv("DB_STATEMENT_CACHE", "256"))
 
     # Feature flag
     payments_enabled: bool = os.getenv("PAYMENTS_ENABLED", "0") == "1"
@@ -1,23 +1,104 @@
-"""Database helpers for SQLite."""
+"""Database helpers for SQLite.
 
+Request handlers must not touch SQLite on the event loop. They go through
+``run_db``, which runs a function on a small dedicated thread pool with a
+connection borrowed from a pool of long-lived connections. Reusing
+connections keeps each one's prepared-statement cache warm, and WAL mode lets
+readers proceed while a write is being committed.
+"""
+
+import asyncio
+import queue
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
 
 from config.settings import settings
 
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pool: "queue.SimpleQueue[sqlite3.Connection]" = queue.SimpleQueue()
+
 
 def get_db() -> sqlite3.Connection:
-    """Get a new database connection with row factory enabled."""
-    conn = sqlite3.connect(settings.db_path, timeout=10)
+    """Get a new database connection with row factory and pragmas applied.
+
+    Only for startup/maintenance code. Request handlers use ``run_db``.
+    """
+    conn = sqlite3.connect(
+        settings.db_path,
+        timeout=10,
+        check_same_thread=False,
+        cached_statements=settings.db_statement_cache,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA synchronous = {settings.db_synchronous}")
+    conn.execute(f"PRAGMA cache_size = -{settings.db_cache_size_kb}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA busy_timeout = 10000")
     return conn
 
 
+def _run_pooled(fn: Callable[..., T], args: tuple) -> T:
+    """Run ``fn(conn, *args)`` on a pooled connection (executor thread)."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = get_db()
+    try:
+        return fn(conn, *args)
+    except BaseException:
+        # Never hand a connection with an open transaction back to the pool
+        conn.rollback()
+        raise
+    finally:
+        _pool.put(conn)
+
+
+async def run_db(fn: Callable[..., T], *args: Any) -> T:
+    """Run ``fn(conn, *args)`` off the event loop and return its result.
+
+    ``fn`` is responsible for committing its own writes.
+    """
+    global _executor
+    if _executor is None:
+        init_db_pool()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _run_pooled, fn, args)
+
+
+def init_db_pool() -> None:
+    """Start the DB thread pool (called from ``main.lifespan``)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.db_pool_size, thread_name_prefix="void-db"
+        )
+
+
+def close_db_pool() -> None:
+    """Stop the DB thread pool and close pooled connections."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
 def init_db() -> None:
     """Initialize the database schema. Creates all tables if they don't exist
     and migrates old schemas when needed."""
     conn = get_db()
     c = conn.cursor()
 
+    # WAL is a property of the database file, so setting it once is enough.
+    c.execute("PRAGMA journal_mode = WAL")
+
     # Pro tokens table
     c.execute("""
         CREATE TABLE IF NOT EXISTS pro_tokens (
@@ -38,6 +119,36 @@ def init_db() -> None:
         )
     """)
 
+    # Credit ledger batches already written through from Redis
+    # (see services/credit_ledger.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_batches (
+            batch_id TEXT PRIMARY KEY,
+            applied_at INTEGER NOT NULL
+        )
+    """)
+
+    # Payment webhooks waiting to be applied (see services/webhook_inbox.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_inbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gateway TEXT NOT NULL,
+            event_key TEXT NOT NULL UNIQUE,
+            body TEXT NOT NULL,
+            received_at INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at INTEGER NOT NULL,
+            claimed_at INTEGER,
+            last_error TEXT,
+            order_id TEXT,
+            token TEXT
+        )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_webhook_inbox_due ON webhook_inbox(status, available_at)"
+    )
+
     # ─── Migrations for existing databases ───
 
     # Add order_id column to invoices (added in payment refactor)
@@ -48,6 +159,16 @@ def init_db() -> None:
     except sqlite3.OperationalError:
         pass  # Column already exists
 
+    # Keep issued tokens with their webhook until they reach Redis
+    for column in ("order_id", "token"):
+        try:
+            c.execute(f"ALTER TABLE webhook_inbox ADD COLUMN {column} TEXT")
+            conn.commit()
+            print(f"Migration: added {column} to webhook_inbox table")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+    c.execute("CREATE INDEX IF NOT EXISTS idx_webhook_inbox_order ON webhook_inbox(order_id)")
+
     # Remove claims table (no longer needed — tokens now issued directly
     # from webhook handler)
     try:
@@ -9,9 +9,18 @@ from fastapi import FastAPI
 from redis.asyncio import Redis
 
 from config.settings import settings
-from db.sqlite import init_db
+from db.sqlite import close_db_pool, init_db, init_db_pool
 from middleware.cors import setup_cors
+from services.ollama import close_ollama_client, start_ollama_client
+from services.context import context_window
+from services.credit_ledger import credit_ledger
+from services.gateway import close_gateway_http
+from services.ollama_pool import ollama_pool
+from services.payment_events import payment_events
+from services.warmup import warmup
+from services.webhook_inbox import webhook_inbox
 from state.redis_state import get_redis, set_redis
+from utils.redis_scripts import load_scripts
 
 
 @asynccontextmanager
@@ -19,20 +28,42 @@ async def lifespan(app: FastAPI):
     """Application startup and shutdown lifecycle."""
     # Startup
     init_db()
+    init_db_pool()
+    await start_ollama_client()
+    await ollama_pool.start()
+    await warmup.start()
     try:
-        redis = Redis.from_url(settings.redis_url, decode_responses=True)
+        redis = Redis.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            socket_timeout=settings.redis_timeout,
+            socket_connect_timeout=settings.redis_timeout,
+        )
         await redis.ping()
         set_redis(redis)
         print(f"Redis connected at {settings.redis_url}")
+        await load_scripts(redis)
     except Exception as e:
         if settings.payments_enabled:
             print(f"WARNING: Redis connection failed: {e}")
             print("Payments are enabled but Redis is unavailable. "
-                  "Rate limiting and credit tracking will not work.")
+                  "Rate limiting falls back to per-process limits.")
         else:
             print("Redis not available — running in self-hosted mode (no limits).")
+    await credit_ledger.start()
+    await payment_events.start()
+    await webhook_inbox.start()  # after Redis: it hands leftover tokens over first
     yield
     # Shutdown
+    await context_window.stop()
+    await warmup.stop()
+    await webhook_inbox.stop()
+    await payment_events.stop()
+    await credit_ledger.stop()
+    await ollama_pool.stop()
+    await close_ollama_client()
+    await close_gateway_http()
+    close_db_pool()
     redis = get_redis()
     if redis is not None:
         await redis.close()
@@ -52,10 +83,16 @@ setup_cors(app)
 from routes.chat import router as chat_router            # noqa: E402
 from routes.models import router as models_router        # noqa: E402
 from routes.config import router as config_router        # noqa: E402
+from routes.metrics import router as metrics_router      # noqa: E402
+from routes.openai import router as openai_router        # noqa: E402
+from routes.warmup import router as warmup_router        # noqa: E402
 
 app.include_router(chat_router)
 app.include_router(models_router, prefix="/models")
 app.include_router(config_router)
+app.include_router(metrics_router)
+app.include_router(openai_router)
+app.include_router(warmup_router)
 
 # Payment and pro routes are only mounted when payments are enabled.
 # This keeps the API surface clean and prevents confusion.
@@ -0,0 +1,23 @@
+"""Admin endpoint protection."""
+
+import hmac
+
+from fastapi import HTTPException, Request
+
+from config.settings import settings
+
+
+async def require_admin(request: Request) -> None:
+    """Allow access to admin/metrics endpoints.
+
+    With ADMIN_TOKEN set, the request must send it in `x-void-admin-token`.
+    Without it, admin endpoints are open in self-hosted mode and hidden (404)
+    in payment mode.
+    """
+    if settings.admin_token:
+        given = request.headers.get("x-void-admin-token", "")
+        if not hmac.compare_digest(given, settings.admin_token):
+            raise HTTPException(status_code=401, detail="Invalid admin token")
+        return
+    if settings.payments_enabled:
+        raise HTTPException(status_code=404, detail="Not found")
@@ -1,32 +1,45 @@
 """Authentication, rate limiting, and payment middleware."""
 
-import hashlib
 import time
 from typing import Dict
 
 from fastapi import HTTPException, Request
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
 
 from config.settings import settings
-from db.sqlite import get_db
-from middleware.rate_limit import RL_LUA
+from middleware.local_limit import LocalRateLimiter
+from middleware.rate_limit import algorithm as rate_limit_algorithm, check_rate_limit
+from services.credits import CreditsUnavailable, debit_credit
 from state.redis_state import get_redis
-from utils.crypto_utils import hash_token
+from utils.crypto_utils import hash_token, window_hasher
 from utils.helpers import get_raw_ip
 
-
-def _rotating_ip_hash(raw_ip: str, window_id: int) -> str:
-    """HMAC-SHA256 with a per-window rotating salt.
-
-    Even if SERVER_SALT is leaked later, old rate-limit keys cannot be
-    brute-forced because each time window used a different derived salt.
-    """
-    # Derive a per-window salt: SHA256(SERVER_SALT || window_id)
-    window_salt = hashlib.sha256(
-        f"{settings.server_salt}:{window_id}".encode()
-    ).hexdigest()
-    return hashlib.sha256(
-        f"{window_salt}:{raw_ip}".encode()
-    ).hexdigest()
+# Loose per-process limit that only stops floods before they reach Redis.
+flood_limiter = LocalRateLimiter(
+    settings.rl_max_requests_ip * settings.rl_local_burst_factor,
+    settings.rl_window_seconds,
+    settings.rl_local_max_entries,
+)
+# Exact per-process limit used while Redis is unavailable.
+fallback_limiter = LocalRateLimiter(
+    settings.rl_max_requests_ip,
+    settings.rl_window_seconds,
+    settings.rl_local_max_entries,
+)
+_redis_degraded = False  # only log the switch to local limits once
+
+
+def _raise_rate_limited(remaining: int, retry_after: int) -> None:
+    raise HTTPException(
+        status_code=429,
+        detail="Too many requests from this IP.",
+        headers={
+            "X-RateLimit-Limit": str(settings.rl_max_requests_ip),
+            "X-RateLimit-Remaining": str(max(remaining, 0)),
+            "Retry-After": str(retry_after),
+        },
+    )
 
 
 async def enforce_limits(request: Request) -> Dict[str, str]:
@@ -34,29 +47,27 @@ async def enforce_limits(request: Request) -> Dict[str, str]:
 
     When PAYMENTS_ENABLED is False: returns empty headers dict (no auth required).
     When PAYMENTS_ENABLED is True: checks IP rate limits and pro tokens.
+    Rate limiting falls back to per-process limits when Redis is unavailable.
 
     Args:
         request: The incoming FastAPI request.
 
     Raises:
         HTTPException: 400 (invalid input), 401 (invalid token), 429 (rate limited),
-                       402 (credits exhausted), 503 (Redis unavailable).
+                       402 (credits exhausted), 503 (credit ledger unavailable).
 
     Returns:
         Dict of response headers to include in the streaming response.
     """
+    global _redis_degraded
     if not settings.payments_enabled:
         # No limits, no auth required — pass-through mode.
         return {}
 
-    redis = get_redis()
-    if redis is None:
-        raise HTTPException(status_code=503, detail="Redis not configured")
-
     # 1. Input & Hashing (Privacy)
-    client_id = request.headers.get("x-void-client-id", "").strip()
-    raw_fp = request.headers.get("x-void-browser-fp", "").strip()
-    raw_ip = get_raw_ip(request)
+    req_headers = request.headers
+    client_id = req_headers.get("x-void-client-id", "").strip()
+    raw_fp = req_headers.get("x-void-browser-fp", "").strip()
 
     # Input validation
     if not client_id or len(client_id) < 10:
@@ -65,17 +76,35 @@ async def enforce_limits(request: Request) -> Dict[str, str]:
         raise HTTPException(status_code=400, detail="Missing Browser Fingerprint.")
 
     # 2. Rate Limiting (DDoS protection — IP-based only, rotating salt)
-    window_id = int(time.time() // settings.rl_window_seconds)
-    ip_hash = _rotating_ip_hash(raw_ip, window_id)
-    rl_key = f"rl:{ip_hash}:{window_id}"
-
-    rem_ip, ttl_ip = await redis.eval(
-        RL_LUA, 1, rl_key, settings.rl_max_requests_ip, settings.rl_window_seconds
-    )
-    if isinstance(rem_ip, list):
-        rem_ip, ttl_ip = int(rem_ip[0]), int(rem_ip[1])
-    else:
-        rem_ip, ttl_ip = int(rem_ip), int(settings.rl_window_seconds)
+    now = time.time()
+    window_id = int(now // settings.rl_window_seconds)
+    ip = get_raw_ip(request).encode()
+    ip_hash = window_hasher.hash(ip, window_id)
+    prev_ip_hash = window_hasher.hash(ip, window_id - 1)
+
+    # Tier 1: local flood filter — rejects without touching Redis.
+    if settings.rl_local_enabled:
+        rem_ip, ttl_ip = flood_limiter.hit(ip_hash, prev_ip_hash, now)
+        if rem_ip < 0:
+            _raise_rate_limited(rem_ip, ttl_ip)
+
+    # Tier 2: shared limit in Redis, or a local fallback when Redis is down.
+    rem_ip = None
+    redis = get_redis()
+    if redis is not None:
+        _, prefix, windows = rate_limit_algorithm()
+        rl_keys = [f"{prefix}:{ip_hash}:{window_id}"]
+        if windows > 1:
+            rl_keys.append(f"{prefix}:{prev_ip_hash}:{window_id - 1}")
+        try:
+            rem_ip, ttl_ip = await check_rate_limit(redis, rl_keys, now=now)
+            _redis_degraded = False
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            if not _redis_degraded:
+                print(f"Rate limiter: Redis unavailable, using local limits: {e}")
+            _redis_degraded = True
+    if rem_ip is None:
+        rem_ip, ttl_ip = fallback_limiter.hit(ip_hash, prev_ip_hash, now)
 
     headers: Dict[str, str] = {
         "X-RateLimit-Limit": str(settings.rl_max_requests_ip),
@@ -83,47 +112,34 @@ async def enforce_limits(request: Request) -> Dict[str, str]:
     }
 
     if rem_ip < 0:
-        headers["Retry-After"] = str(ttl_ip)
-        raise HTTPException(
-            status_code=429,
-            detail="Too many requests from this IP.",
-            headers=headers,
-        )
+        _raise_rate_limited(rem_ip, ttl_ip)
 
     # 3. PRO TOKEN check
-    pro_token = request.headers.get("x-void-pro-token", "").strip()
+    pro_token = req_headers.get("x-void-pro-token", "").strip()
     if pro_token:
         th = hash_token(pro_token)
-        conn = get_db()
         try:
-            row = conn.execute(
-                "SELECT credits_left FROM pro_tokens WHERE token_hash = ?", (th,)
-            ).fetchone()
-            if not row:
-                raise HTTPException(
-                    status_code=401, detail="Invalid Pro Token", headers=headers
-                )
-            if int(row[0]) <= 0:
-                headers["X-Pro-Left"] = "0"
-                raise HTTPException(
-                    status_code=402,
-                    detail="Pro credits exhausted",
-                    headers=headers,
-                )
-
-            conn.execute(
-                "UPDATE pro_tokens SET credits_left = credits_left - 1 WHERE token_hash = ?",
-                (th,),
+            left = await debit_credit(th)
+        except CreditsUnavailable:
+            raise HTTPException(
+                status_code=503,
+                detail="Credits temporarily unavailable",
+                headers={**headers, "Retry-After": "5"},
+            )
+        if left is None:
+            raise HTTPException(
+                status_code=401, detail="Invalid Pro Token", headers=headers
+            )
+        if left < 0:
+            headers["X-Pro-Left"] = "0"
+            raise HTTPException(
+                status_code=402,
+                detail="Pro credits exhausted",
+                headers=headers,
             )
-            conn.commit()
-            row = conn.execute(
-                "SELECT credits_left FROM pro_tokens WHERE token_hash = ?", (th,)
-            ).fetchone()
-            left = int(row[0])
-            headers["X-Pro-Left"] = str(left)
-            return headers
-        finally:
-            conn.close()
+        headers["X-Pro-Left"] = str(left)
+        request.state.debited_token = th  # refunded if the request is never served
+        return headers
 
     # No pro token — user is in payment mode without credits.
     # Allow the request (user should be able to chat freely; credits tracked via pro token only).
@@ -26,6 +26,10 @@ def setup_cors(app: FastAPI) -> None:
         "X-RateLimit-Limit",
         "X-RateLimit-Remaining",
         "Retry-After",
+        "X-Queue-Wait-Ms",
+        "X-Cache",
+        "X-Shared-Stream",
+        "X-Context-Trimmed",
     ]
 
     app.add_middleware(
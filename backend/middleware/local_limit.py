@@ -0,0 +1,64 @@
+"""Per-process token-bucket rate limiter.
+
+Used in two ways by ``middleware/auth.py``:
+
+- as a first tier in front of Redis, with a looser limit, so obvious floods
+  are rejected without a network round trip;
+- as the limiter of last resort when Redis is missing or unreachable, so
+  payment mode degrades to per-process limits instead of failing with 503.
+
+Buckets are keyed by the rotating IP hash. A missing bucket is seeded from the
+previous window's bucket, so limits carry across the salt rotation. Full
+buckets hold no information and are swept periodically. The table is
+bounded; when full, the oldest buckets are dropped.
+"""
+
+import math
+from typing import Dict, List, Tuple
+
+
+class LocalRateLimiter:
+    """Token buckets (capacity per ``window`` seconds) kept in a plain dict."""
+
+    __slots__ = ("capacity", "window", "rate", "max_entries", "sweep_interval",
+                 "_buckets", "_next_sweep")
+
+    def __init__(self, capacity: float, window: float, max_entries: int, sweep_interval: float = 0):
+        self.capacity = float(capacity)
+        self.window = float(window)
+        self.rate = self.capacity / self.window
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval or self.window
+        # key -> [tokens, last update]; lists keep the per-entry footprint small
+        self._buckets: Dict[str, List[float]] = {}
+        self._next_sweep = 0.0
+
+    def hit(self, key: str, prev_key: str, now: float) -> Tuple[int, int]:
+        """Take one token. Returns (remaining, retry_after); remaining < 0 means limited."""
+        if now >= self._next_sweep:
+            self._sweep(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets.pop(prev_key, None) or [self.capacity, now]
+            if len(self._buckets) >= self.max_entries:
+                # dicts keep insertion order: drop the oldest bucket
+                del self._buckets[next(iter(self._buckets))]
+            self._buckets[key] = bucket
+        tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return -1, max(1, math.ceil((1 - tokens) / self.rate))
+        bucket[0] = tokens - 1
+        return int(tokens - 1), int(self.window)
+
+    def _sweep(self, now: float) -> None:
+        """Drop buckets that have refilled completely."""
+        full = self.window  # seconds for an empty bucket to refill
+        stale = [k for k, (_, ts) in self._buckets.items() if now - ts >= full]
+        for k in stale:
+            del self._buckets[k]
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self) -> int:
+        return len(self._buckets)
@@ -1,4 +1,28 @@
-"""Redis Lua scripts for atomic rate limiting."""
+"""Redis Lua scripts for atomic rate limiting.
+
+Three algorithms, selected with RL_ALGORITHM:
+
+- ``fixed``: one counter per window. Cheapest, but allows up to twice the
+  limit in a burst straddling a window edge.
+- ``sliding``: a log of request timestamps (sorted set); exact limit over
+  any window-length interval, memory grows with the limit.
+- ``token_bucket``: capacity RL_MAX_REQUESTS_IP, refilled continuously over
+  RL_WINDOW_SECONDS; smooths bursts with O(1) state.
+
+Rate-limit keys embed an IP hash whose salt rotates every window (see
+``middleware/auth.py``). The sliding and token-bucket scripts therefore get
+two keys: this window's and the previous window's, so state carries across
+the rotation while no key outlives two windows.
+"""
+
+import secrets
+import time
+from typing import List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from config.settings import settings
+from utils.redis_scripts import LuaScript
 
 # Atomically increments the request counter for rate limiting within a time window.
 # Returns {remaining_requests, ttl} or {-1, ttl} if rate limited.
@@ -14,3 +38,94 @@ if current > maxv then
 end
 return {maxv - current, ttl}
 """
+
+# Sliding-window log over KEYS[1] (this window) and KEYS[2] (previous window).
+# ARGV: max requests, window seconds, unique member for this request.
+# Returns {remaining_requests, window} or {-1, seconds_until_a_slot_frees}.
+RL_SLIDING_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local maxv = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000000
+local cutoff = now - window
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', cutoff)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', cutoff)
+local count = redis.call('ZCARD', KEYS[1]) + redis.call('ZCARD', KEYS[2])
+if count >= maxv then
+  local oldest = now
+  for _, k in ipairs(KEYS) do
+    local first = redis.call('ZRANGE', k, 0, 0, 'WITHSCORES')
+    if first[2] and tonumber(first[2]) < oldest then
+      oldest = tonumber(first[2])
+    end
+  end
+  return {-1, math.max(1, math.ceil((oldest + window - now) / 1000000))}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[3])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+return {maxv - count - 1, tonumber(ARGV[2])}
+"""
+
+# Token bucket in KEYS[1], seeded from KEYS[2] (previous window) when empty.
+# ARGV: capacity, seconds to refill the whole bucket.
+# Returns {remaining_tokens, window} or {-1, seconds_until_next_token}.
+RL_TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local rate = capacity / window
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+if not state[1] then
+  state = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+end
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = tokens >= 1
+if allowed then
+  tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], window * 2)
+if allowed then
+  return {math.floor(tokens), window}
+end
+return {-1, math.max(1, math.ceil((1 - tokens) / rate))}
+"""
+
+RL_SCRIPT = LuaScript(RL_LUA)
+RL_SLIDING_SCRIPT = LuaScript(RL_SLIDING_LUA)
+RL_TOKEN_BUCKET_SCRIPT = LuaScript(RL_TOKEN_BUCKET_LUA)
+
+# algorithm -> (script, key prefix, number of windows the script needs)
+# Prefixes differ so switching algorithms never hits a WRONGTYPE key.
+ALGORITHMS = {
+    "fixed": (RL_SCRIPT, "rl", 1),
+    "sliding": (RL_SLIDING_SCRIPT, "rls", 2),
+    "token_bucket": (RL_TOKEN_BUCKET_SCRIPT, "rlb", 2),
+}
+
+
+def algorithm() -> Tuple[LuaScript, str, int]:
+    return ALGORITHMS.get(settings.rl_algorithm, ALGORITHMS["fixed"])
+
+
+async def check_rate_limit(
+    redis: Redis, keys: List[str], member: Optional[str] = None, now: float = 0.0
+) -> Tuple[int, int]:
+    """Count one request against ``keys`` (built for ``algorithm()``).
+
+    ``member`` is the unique sliding-window entry; one is generated from
+    ``now`` if not given (and only when the sliding script needs it).
+
+    Returns (remaining, retry_after_or_ttl); remaining < 0 means rate limited.
+    """
+    script, _, _ = algorithm()
+    args = [settings.rl_max_requests_ip, settings.rl_window_seconds]
+    if script is RL_SLIDING_SCRIPT:
+        args.append(member or f"{now or time.time():.6f}:{secrets.token_hex(4)}")
+    res = await script(redis, keys, args)
+    if isinstance(res, list):
+        return int(res[0]), int(res[1])
+    return int(res), int(settings.rl_window_seconds)
@@ -1,7 +1,7 @@
 """Pydantic request/response models."""
 
-from typing import List, Literal, Optional
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, Field
 
 
 class ChatMsg(BaseModel):
@@ -13,6 +13,32 @@ class ChatIn(BaseModel):
     messages: Optional[List[ChatMsg]] = None
     message: Optional[str] = None
     model: Optional[str] = None  # Optional model override
+    # Optional stream coalescing (capped by STREAM_COALESCE_MAX_*)
+    coalesce_bytes: Optional[int] = Field(default=None, ge=0)
+    coalesce_ms: Optional[float] = Field(default=None, ge=0)
+    cache: Optional[bool] = None  # False skips the response cache
+
+
+class OpenAIStreamOptions(BaseModel):
+    include_usage: bool = False
+
+
+class OpenAIChatIn(BaseModel):
+    """Subset of the OpenAI chat completions request that maps onto Ollama."""
+
+    model: Optional[str] = None
+    messages: List[ChatMsg]
+    stream: bool = False
+    stream_options: Optional[OpenAIStreamOptions] = None
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    max_tokens: Optional[int] = None
+    stop: Optional[Union[str, List[str]]] = None
+    seed: Optional[int] = None
+
+
+class WarmupIn(BaseModel):
+    models: Optional[List[str]] = None  # default: WARMUP_MODELS
 
 
 class ClaimIn(BaseModel):
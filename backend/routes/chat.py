@@ -1,20 +1,88 @@
 """Chat routes — streaming chat completions via Ollama."""
 
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, AsyncIterable, Dict, Union
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from config.settings import settings
 from middleware.auth import enforce_limits
 from models.pydantic import ChatIn
-from services.ollama import stream_ollama_chat
-from utils.helpers import build_messages
+from services.admission import AdmissionRejected, Lease, admission
+from services.broadcast import BroadcastStream
+from services.context import context_window
+from services.credits import refund_credit
+from services.ollama import chat_payload, stream_ollama_events, usage_from_done
+from services.response_cache import CachedResponse, cache_key, response_cache
+from utils.crypto_utils import secure_hash
+from utils.helpers import build_messages, get_raw_ip
+from utils.streaming import coalesce_chunks, sse_event
 
 router = APIRouter()
 
+# Identical requests currently generating (canonical payload hash -> stream)
+_inflight: Dict[str, BroadcastStream] = {}
+_joined_total = 0
 
-@router.post("/chat/stream")
+
+async def reject_if_queue_full() -> None:
+    """Fail fast with 503 before auth runs (and a pro credit is spent)."""
+    if admission.is_full():
+        admission.rejected_full += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, queue full",
+            headers={"Retry-After": str(admission.retry_after())},
+        )
+
+
+def _coalesce_params(body: ChatIn) -> tuple:
+    """Per-request (max_bytes, max_delay_seconds), clamped by server limits."""
+    nbytes = settings.stream_coalesce_bytes if body.coalesce_bytes is None else body.coalesce_bytes
+    ms = settings.stream_coalesce_ms if body.coalesce_ms is None else body.coalesce_ms
+    return (
+        min(nbytes, settings.stream_coalesce_max_bytes),
+        min(ms, settings.stream_coalesce_max_ms) / 1000,
+    )
+
+
+def client_key(request: Request) -> str:
+    """Hashed identity used for fair queueing and backend affinity (client ID, else IP)."""
+    key = getattr(request.state, "client_key", None)
+    if key is None:
+        client_id = request.headers.get("x-void-client-id", "").strip()
+        key = request.state.client_key = secure_hash(client_id or get_raw_ip(request))
+    return key
+
+
+async def admit(request: Request, headers: dict) -> Lease:
+    """Wait in the admission queue; 503 with Retry-After if rejected."""
+    # enforce_limits only sets X-Pro-Left after a pro token was validated
+    pro = "X-Pro-Left" in headers
+    try:
+        lease = await admission.acquire(client_key(request), pro=pro)
+    except AdmissionRejected as e:
+        # The credit was spent by enforce_limits; nothing was served for it.
+        debited = getattr(request.state, "debited_token", None)
+        if debited is not None:
+            await refund_credit(debited)
+            headers["X-Pro-Left"] = str(int(headers["X-Pro-Left"]) + 1)
+        raise HTTPException(
+            status_code=503,
+            detail=e.reason,
+            headers={**headers, "Retry-After": str(e.retry_after)},
+        )
+    headers["X-Queue-Wait-Ms"] = str(int(lease.wait_ms))
+    return lease
+
+
+def wants_sse(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+@router.post("/chat/stream", dependencies=[Depends(reject_if_queue_full)])
 async def chat_stream(
     request: Request,
     body: ChatIn,
@@ -26,22 +94,133 @@ async def chat_stream(
     When disabled, works without any authentication.
 
     Accepts an optional `model` field in the request body to override the default model.
+
+    Optional `coalesce_bytes` / `coalesce_ms` merge tokens into fewer writes
+    (the first token is always sent immediately).
+
+    With `Accept: text/event-stream` the reply is sent as Server-Sent Events:
+    `data: {"content": "..."}` per chunk, then an `event: usage` frame with
+    token counts, timings and tokens per second.
+
+    With RESPONSE_CACHE_ENABLED=1, identical requests are answered from the
+    response cache (X-Cache: HIT) unless the body sets `"cache": false`.
+    An identical request that is still generating is shared instead of
+    starting a second generation (X-Shared-Stream: 1).
+
+    History longer than the model's token budget is trimmed oldest turns
+    first, keeping system prompts (X-Context-Trimmed: messages dropped).
+
+    Requests wait for a free backend slot in the admission queue first; when
+    the queue is full they are rejected with 503 and Retry-After.
     """
     model = body.model or settings.ollama_model
+    messages, dropped = context_window.fit(model, build_messages(body))
+    if dropped:
+        headers["X-Context-Trimmed"] = str(dropped)
 
-    payload = {
-        "model": model,
-        "messages": build_messages(body),
-        "stream": True,
-        "keep_alive": "5m",
-    }
+    payload = chat_payload(model, messages)
+    affinity = client_key(request)
+
+    max_bytes, max_delay = _coalesce_params(body)
+    sse = wants_sse(request)
+    if sse:
+        headers["Cache-Control"] = "no-cache"
+        headers["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    media_type = "text/event-stream" if sse else "text/plain; charset=utf-8"
+
+    def frames(events: AsyncIterable[Union[bytes, dict]]) -> AsyncIterable[bytes]:
+        async def format_events() -> AsyncGenerator[bytes, None]:
+            async for event in events:
+                if isinstance(event, bytes):
+                    yield sse_event({"content": event.decode("utf-8")}) if sse else event
+                elif sse:
+                    yield sse_event(usage_from_done(event), event="usage")
+
+        return coalesce_chunks(format_events(), max_bytes, max_delay)
+
+    use_cache = response_cache.enabled and body.cache is not False
+    key = cache_key(payload) if use_cache or settings.chat_dedup_inflight else None
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            headers["X-Cache"] = "HIT"
+            return StreamingResponse(
+                frames(_replay(cached)), media_type=media_type, headers=headers
+            )
+        headers["X-Cache"] = "MISS"
+
+    # An identical request is already generating: follow its stream.
+    broadcast = _inflight.get(key) if key is not None else None
+    if broadcast is not None:
+        sub = broadcast.subscribe()
+        headers["X-Shared-Stream"] = "1"
+        return StreamingResponse(
+            frames(sub),
+            media_type=media_type,
+            headers=headers,
+            # Safety net if the body is never iterated; close is idempotent.
+            background=BackgroundTask(sub.close),
+        )
+
+    lease = await admit(request, headers)
+    started = time.monotonic()
+
+    async def events() -> AsyncGenerator[Union[bytes, dict], None]:
+        """Upstream events, recording the reply for the cache when enabled."""
+        parts = []
+        try:
+            async for event in stream_ollama_events(payload, is_disconnected, affinity):
+                if use_cache:
+                    if isinstance(event, bytes):
+                        parts.append(event)
+                    else:
+                        await response_cache.store(key, CachedResponse(b"".join(parts), event))
+                yield event
+        finally:
+            admission.record_duration(time.monotonic() - started)
+            lease.release()
 
-    async def gen() -> AsyncGenerator[bytes, None]:
-        async for chunk in stream_ollama_chat(payload, request.is_disconnected):
-            yield chunk
+    if key is None:
+        is_disconnected = request.is_disconnected
+        source, close = events(), lease.release
+    else:
+        # Run upstream in its own task so identical requests can join it.
+        # The task owns the lease; it ends when the last subscriber leaves.
+        def finished() -> None:
+            lease.release()
+            _forget(key, broadcast)
+
+        broadcast = BroadcastStream(events(), on_finish=finished)
+        is_disconnected = broadcast.abandoned
+        _inflight[key] = broadcast
+        source = broadcast.subscribe()
+        close = source.close
 
     return StreamingResponse(
-        gen(),
-        media_type="text/plain; charset=utf-8",
+        frames(source),
+        media_type=media_type,
         headers=headers,
+        # Safety net if the body is never iterated; release/close are idempotent.
+        background=BackgroundTask(close),
     )
+
+
+def _forget(key: str, broadcast: BroadcastStream) -> None:
+    global _joined_total
+    _joined_total += broadcast.joined
+    if _inflight.get(key) is broadcast:
+        del _inflight[key]
+
+
+def inflight_stats() -> dict:
+    return {
+        "enabled": settings.chat_dedup_inflight,
+        "streams": len(_inflight),
+        "subscribers_joined": _joined_total + sum(b.joined for b in _inflight.values()),
+    }
+
+
+async def _replay(cached: CachedResponse) -> AsyncGenerator[Union[bytes, dict], None]:
+    """Replay a cached reply as the same events the upstream stream yields."""
+    yield cached.text
+    yield cached.done
@@ -3,6 +3,9 @@
 from fastapi import APIRouter
 
 from config.settings import settings
+from services.models_cache import models_cache
+from services.ollama import rebuild_ollama_client
+from services.ollama_pool import ollama_pool
 
 router = APIRouter()
 
@@ -44,5 +47,11 @@ async def set_ai_base_url(data: dict):
     url = data.get("url", "").strip()
     if not url.startswith(("http://", "https://")):
         return {"error": "URL must start with http:// or https://"}
-    settings.set_ollama_base_url(url)
+    if url != settings.ollama_base_url:
+        settings.set_ollama_base_url(url)
+        # Drop keep-alive connections and host limits tied to the old backend
+        await rebuild_ollama_client()
+        ollama_pool.configure(settings.ollama_base_urls)
+        models_cache.invalidate()
+        await ollama_pool.probe_all()
     return {"ok": True, "ai_base_url": settings.ollama_base_url}
@@ -4,10 +4,12 @@ These routes are only mounted when PAYMENTS_ENABLED=1,
 so all handlers assume authentication and Redis are active.
 """
 
+import sqlite3
+
 from fastapi import APIRouter, Request, HTTPException
 
 from config.settings import settings
-from db.sqlite import get_db
+from db.sqlite import run_db
 from state.redis_state import get_redis
 
 router = APIRouter()
@@ -30,13 +32,13 @@ async def dev_reset_free(request: Request):
     redis_key = f"free:{client_id}"
     await redis.set(redis_key, settings.free_limit, ex=settings.free_ttl_seconds)
 
-    conn = get_db()
-    try:
-        conn.execute(
-            "UPDATE free_usage SET last_reset = 0 WHERE client_id = ?", (client_id,)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    await run_db(_reset_free_usage, client_id)
 
     return {"free_left": settings.free_limit}
+
+
+def _reset_free_usage(conn: sqlite3.Connection, client_id: str) -> None:
+    conn.execute(
+        "UPDATE free_usage SET last_reset = 0 WHERE client_id = ?", (client_id,)
+    )
+    conn.commit()
@@ -0,0 +1,41 @@
+"""Metrics route — runtime counters for load testing and monitoring."""
+
+from fastapi import APIRouter, Depends
+
+from middleware.admin import require_admin
+from routes.chat import inflight_stats
+from services.admission import admission
+from services.context import context_window
+from services.credit_ledger import credit_ledger
+from services.btcpay import btcpay
+from services.credits import cache_stats
+from services.models_cache import models_cache
+from services.nowpayments import nowpayments
+from services.payment_events import payment_events
+from services.ollama_pool import ollama_pool
+from services.price_quotes import price_quotes
+from services.response_cache import response_cache
+from services.warmup import warmup
+from services.webhook_inbox import webhook_inbox
+
+router = APIRouter()
+
+
+@router.get("/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    """Return admission queue, backend pool, credit and cache statistics."""
+    return {
+        "admission": admission.stats(),
+        "ollama": ollama_pool.stats(),
+        "credit_ledger": credit_ledger.stats(),
+        "token_cache": cache_stats(),
+        "response_cache": response_cache.stats(),
+        "shared_streams": inflight_stats(),
+        "models_cache": models_cache.stats(),
+        "context": context_window.stats(),
+        "warmup": warmup.stats(),
+        "price_quotes": price_quotes.stats(),
+        "webhook_inbox": await webhook_inbox.stats(),
+        "payment_events": payment_events.stats(),
+        "gateways": {"nowpayments": nowpayments.stats(), "btcpay": btcpay.stats()},
+    }
@@ -1,13 +1,27 @@
 """Models route — lists available Ollama models."""
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 
-from services.ollama import fetch_ollama_models
+from config.settings import settings
+from services.models_cache import models_cache
 
 router = APIRouter()
 
 
 @router.get("")
-async def get_models():
-    """Return available models from the Ollama instance."""
-    return await fetch_ollama_models()
+async def get_models(request: Request, response: Response):
+    """Return available models from the Ollama instance.
+
+    Served from ``models_cache``. Sends an ETag and Cache-Control so browsers
+    and CDNs can revalidate cheaply (304) or skip the request.
+    """
+    data, etag = await models_cache.get()
+    ttl = int(settings.models_cache_ttl)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={ttl}, stale-while-revalidate={int(settings.models_cache_stale)}",
+    }
+    if etag and etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return data
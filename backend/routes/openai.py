@@ -0,0 +1,167 @@
+"""OpenAI-compatible routes — /v1/chat/completions and /v1/models.
+
+Lets OpenAI client libraries, load generators and proxies talk to VOID AI
+directly. Requests go through the same rate limits, credits and admission
+queue as ``/chat/stream``. Usage (token counts) comes from Ollama's final
+``done`` object; ``usage.void`` adds timings and tokens per second.
+"""
+
+import secrets
+import time
+from typing import AsyncGenerator
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from config.settings import settings
+from middleware.auth import enforce_limits
+from models.pydantic import OpenAIChatIn
+from routes.chat import admit, client_key, reject_if_queue_full
+from services.admission import admission
+from services.context import context_window
+from services.models_cache import models_cache
+from services.ollama import chat_payload, stream_ollama_events, usage_from_done
+from utils.helpers import canonical_messages
+from utils.streaming import coalesce_chunks, sse_event
+
+router = APIRouter(prefix="/v1")
+
+
+def _options(body: OpenAIChatIn) -> dict:
+    """Map OpenAI sampling parameters to Ollama options."""
+    options = {}
+    if body.temperature is not None:
+        options["temperature"] = body.temperature
+    if body.top_p is not None:
+        options["top_p"] = body.top_p
+    if body.max_tokens is not None:
+        options["num_predict"] = body.max_tokens
+    if body.seed is not None:
+        options["seed"] = body.seed
+    if body.stop:
+        options["stop"] = [body.stop] if isinstance(body.stop, str) else body.stop
+    return options
+
+
+def _usage(done: dict) -> dict:
+    usage = usage_from_done(done)
+    return {
+        "prompt_tokens": usage.pop("prompt_tokens"),
+        "completion_tokens": usage.pop("completion_tokens"),
+        "total_tokens": usage.pop("total_tokens"),
+        "void": usage,
+    }
+
+
+def _finish_reason(done: dict) -> str:
+    return "length" if done.get("done_reason") == "length" else "stop"
+
+
+@router.post("/chat/completions", dependencies=[Depends(reject_if_queue_full)])
+async def chat_completions(
+    request: Request,
+    body: OpenAIChatIn,
+    headers: dict = Depends(enforce_limits),
+):
+    """OpenAI-style chat completion, streamed (SSE) or as one JSON object.
+
+    With `stream_options.include_usage` the stream ends with a chunk that has
+    empty `choices` and the `usage` totals, as OpenAI does; otherwise usage is
+    attached to the final chunk.
+    """
+    model = body.model or settings.ollama_model
+    messages, dropped = context_window.fit(model, canonical_messages(body.messages))
+    if dropped:
+        headers["X-Context-Trimmed"] = str(dropped)
+    payload = chat_payload(model, messages, _options(body))
+    affinity = client_key(request)
+
+    lease = await admit(request, headers)
+    completion_id = f"chatcmpl-{secrets.token_hex(12)}"
+    created = int(time.time())
+    started = time.monotonic()
+
+    if not body.stream:
+        try:
+            parts, done = [], {}
+            async for event in stream_ollama_events(payload, request.is_disconnected, affinity):
+                if isinstance(event, bytes):
+                    parts.append(event)
+                else:
+                    done = event
+        finally:
+            admission.record_duration(time.monotonic() - started)
+            lease.release()
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": b"".join(parts).decode("utf-8")},
+                "finish_reason": _finish_reason(done),
+            }],
+            "usage": _usage(done),
+        }, headers=headers)
+
+    include_usage = bool(body.stream_options and body.stream_options.include_usage)
+
+    def frame(choices: list, **extra) -> bytes:
+        return sse_event({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": choices,
+            **extra,
+        })
+
+    def delta(content: dict, finish_reason=None, **extra) -> bytes:
+        return frame([{"index": 0, "delta": content, "finish_reason": finish_reason}], **extra)
+
+    async def frames() -> AsyncGenerator[bytes, None]:
+        yield delta({"role": "assistant", "content": ""})
+        async for event in stream_ollama_events(payload, request.is_disconnected, affinity):
+            if isinstance(event, bytes):
+                yield delta({"content": event.decode("utf-8")})
+            elif include_usage:
+                yield delta({}, _finish_reason(event))
+                yield frame([], usage=_usage(event))
+            else:
+                yield delta({}, _finish_reason(event), usage=_usage(event))
+        yield b"data: [DONE]\n\n"
+
+    async def gen() -> AsyncGenerator[bytes, None]:
+        try:
+            async for data in coalesce_chunks(
+                frames(), settings.stream_coalesce_bytes, settings.stream_coalesce_ms / 1000
+            ):
+                yield data
+        finally:
+            admission.record_duration(time.monotonic() - started)
+            lease.release()
+
+    headers["Cache-Control"] = "no-cache"
+    headers["X-Accel-Buffering"] = "no"
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers=headers,
+        # Safety net if the body is never iterated; release is idempotent.
+        background=BackgroundTask(lease.release),
+    )
+
+
+@router.get("/models")
+async def list_models():
+    """Installed models in OpenAI's list format."""
+    data, _ = await models_cache.get()
+    return {
+        "object": "list",
+        "data": [
+            {"id": name, "object": "model", "created": 0, "owned_by": "ollama"}
+            for name in data["models"]
+        ],
+    }
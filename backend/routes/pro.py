@@ -1,9 +1,20 @@
-"""Pro token routes — status check and payment polling."""
+"""Pro token routes — status check and payment completion (polling or SSE)."""
+
+import asyncio
+import sqlite3
+import time
+from typing import AsyncGenerator
 
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 
 from config.settings import settings
+from db.sqlite import run_db
+from services.credits import get_credits
+from services.payment_events import PAYMENT_TOKEN_KEY, payment_events
+from state.redis_state import get_redis
 from utils.crypto_utils import hash_token
+from utils.streaming import sse_event
 
 
 router = APIRouter()
@@ -16,21 +27,21 @@ async def pro_status(request: Request):
     if not token:
         return {"status": "off", "credits_left": 0}
 
-    th = hash_token(token)
-    from db.sqlite import get_db
+    left = await get_credits(hash_token(token))
+    if left is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    status = "active" if left > 0 else "exhausted"
+    return {"status": status, "credits_left": left}
 
-    conn = get_db()
-    try:
-        row = conn.execute(
-            "SELECT credits_left FROM pro_tokens WHERE token_hash = ?", (th,)
-        ).fetchone()
-        if not row:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        left = row["credits_left"]
-        status = "active" if left > 0 else "exhausted"
-        return {"status": status, "credits_left": left}
-    finally:
-        conn.close()
+
+def _is_order_paid(conn: sqlite3.Connection, order_id: str) -> bool:
+    """True once the order is paid and its token was handed to Redis."""
+    row = conn.execute(
+        "SELECT 1 FROM invoices WHERE order_id = ? AND status = 'paid' "
+        "AND NOT EXISTS (SELECT 1 FROM webhook_inbox WHERE order_id = ? AND status = 'issued')",
+        (order_id, order_id),
+    ).fetchone()
+    return row is not None
 
 
 @router.get("/pending-payment/{order_id}")
@@ -39,31 +50,76 @@ async def get_pending_payment(order_id: str):
 
     Used by the frontend to poll for payment completion after the
     user has sent crypto. The token is stored in Redis by the webhook
-    handler when NOWPayments confirms the payment.
+    handler when NOWPayments confirms the payment. Prefer
+    `/pro/payment-events/{order_id}`, which pushes it instead.
     """
-    from state.redis_state import get_redis
-
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis not available")
 
-    token = await redis.get(f"void:payment_token:{order_id}")
+    token = await redis.get(PAYMENT_TOKEN_KEY.format(order_id))
     if not token:
         # Check if payment exists in DB but wasn't stored in Redis
-        from db.sqlite import get_db
+        if await run_db(_is_order_paid, order_id):
+            # Payment confirmed but token already stored elsewhere
+            return {"status": "completed", "token": None}
+        return {"status": "waiting"}
+
+    return {"status": "completed", "token": token.decode() if isinstance(token, bytes) else token}
+
 
-        conn = get_db()
+@router.get("/payment-events/{order_id}")
+async def payment_events_stream(order_id: str, request: Request):
+    """Server-Sent Events stream that pushes the token once the order is paid.
+
+    Sends one `event: completed` frame with `{"token": ...}` and closes
+    (`token` is null if it was already handed out). Until then it only sends
+    keep-alive comments every PAYMENT_EVENTS_HEARTBEAT seconds. The stream
+    ends after PAYMENT_EVENTS_TIMEOUT seconds; EventSource reconnects on its
+    own. Returns 503 when the Redis subscription is down, so the frontend
+    can fall back to polling `/pro/pending-payment/{order_id}`.
+    """
+    redis = get_redis()
+    if redis is None or not payment_events.available:
+        raise HTTPException(status_code=503, detail="Payment events not available")
+
+    # Subscribe first, so a token published during the lookups isn't missed.
+    future = payment_events.subscribe(order_id)
+    try:
+        key = PAYMENT_TOKEN_KEY.format(order_id)
+        token = await redis.get(key)
+        paid = token is not None or await run_db(_is_order_paid, order_id)
+        if paid and token is None:
+            # Delivered between the two lookups, or the key already expired.
+            token = await redis.get(key)
+    except Exception:
+        payment_events.unsubscribe(order_id, future)
+        raise
+
+    async def events() -> AsyncGenerator[bytes, None]:
         try:
-            row = conn.execute(
-                "SELECT invoice_id, credits FROM invoices WHERE order_id = ? AND status = 'paid'",
-                (order_id,),
-            ).fetchone()
-            if row:
-                # Payment confirmed but token already stored elsewhere
-                return {"status": "completed", "token": None}
-            return {"status": "waiting"}
+            yield b"retry: 5000\n\n"
+            if paid:
+                yield sse_event({"token": token}, event="completed")
+                return
+            deadline = time.monotonic() + settings.payment_events_timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    found = await asyncio.wait_for(
+                        asyncio.shield(future), min(settings.payment_events_heartbeat, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield b": ping\n\n"
+                    continue
+                yield sse_event({"token": found}, event="completed")
+                return
         finally:
-            conn.close()
-        return
+            payment_events.unsubscribe(order_id, future)
 
-    return {"status": "completed", "token": token.decode() if isinstance(token, bytes) else token}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,22 @@
+"""Warm-up route — load models into memory on demand."""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+
+from middleware.admin import require_admin
+from models.pydantic import WarmupIn
+from services.warmup import warmup
+
+router = APIRouter()
+
+
+@router.post("/warmup", dependencies=[Depends(require_admin)])
+async def trigger_warmup(body: Optional[WarmupIn] = None):
+    """Load models on every backend that has them installed.
+
+    Without a body, warms WARMUP_MODELS (default: OLLAMA_MODEL). Waits for the
+    loads to finish and returns the load time per backend.
+    """
+    models = (body.models if body and body.models else None) or warmup.configured_models()
+    return {"results": await warmup.preload(models)}
@@ -0,0 +1,202 @@
+"""Admission control for chat streams.
+
+Every ``/chat/stream`` request needs a slot before it is sent upstream. The
+number of slots is ``ollama_max_concurrency_per_backend`` times the number of
+healthy backends, so Ollama never queues work internally where we can't see
+it. Requests that don't get a slot wait in a bounded queue:
+
+- paying (pro-token) requests are served ahead of others, ``admission_pro_weight``
+  to one, so free traffic is slowed down rather than starved;
+- within a tier, clients (hashed client IDs) are served round-robin, so one
+  client with many parallel requests can't push everyone else back;
+- when the queue is full, or a request has waited ``admission_queue_timeout``
+  seconds, it is rejected with a Retry-After estimate.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from config.settings import settings
+from services.ollama_pool import ollama_pool
+
+PRO = 0
+FREE = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted (queue full or wait timed out)."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lease:
+    """A granted slot. ``release`` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", wait_ms: float):
+        self._controller = controller
+        self._released = False
+        self.wait_ms = wait_ms
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """Bounded, fair, priority-aware queue in front of the Ollama pool."""
+
+    def __init__(self):
+        self.active = 0
+        # tier -> client key -> FIFO of waiter futures
+        self._queues: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            PRO: OrderedDict(),
+            FREE: OrderedDict(),
+        }
+        self._depth = 0
+        self._pro_streak = 0
+        # Metrics
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._service_s = 10.0  # EWMA of stream duration, for Retry-After
+
+    @property
+    def capacity(self) -> int:
+        healthy = sum(1 for n in ollama_pool.nodes if n.healthy) or len(ollama_pool.nodes) or 1
+        return healthy * settings.ollama_max_concurrency_per_backend
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def is_full(self) -> bool:
+        """True if a new request would be rejected right away."""
+        return self.active >= self.capacity and self._depth >= settings.admission_queue_max
+
+    def retry_after(self) -> int:
+        """Rough seconds until a slot frees up for a request queued now."""
+        per_slot = self._service_s / max(self.capacity, 1)
+        return max(1, math.ceil(per_slot * (self._depth + 1)))
+
+    async def acquire(self, client_key: str, pro: bool = False) -> Lease:
+        """Wait for a slot. Raises AdmissionRejected if the queue is full or the wait times out."""
+        start = time.monotonic()
+        if self.active < self.capacity and self._depth == 0:
+            return self._grant(start)
+        if self._depth >= settings.admission_queue_max:
+            self.rejected_full += 1
+            raise AdmissionRejected("Server busy, queue full", self.retry_after())
+
+        tier = PRO if pro else FREE
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._queues[tier].setdefault(client_key, deque()).append(fut)
+        self._depth += 1
+        # Capacity may have grown (a backend came back) since the last release.
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), settings.admission_queue_timeout)
+        except asyncio.TimeoutError:
+            if self._cancel(tier, client_key, fut):
+                self.rejected_timeout += 1
+                raise AdmissionRejected("Server busy, timed out in queue", self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away while queued. If the slot was already handed
+            # over, give it back so the next waiter gets it.
+            if not self._cancel(tier, client_key, fut):
+                self._release()
+            raise
+        return self._grant(start, reserved=True)
+
+    def _grant(self, start: float, reserved: bool = False) -> Lease:
+        if not reserved:
+            self.active += 1
+        wait_ms = (time.monotonic() - start) * 1000
+        self._waits.append(wait_ms)
+        self.admitted += 1
+        return Lease(self, wait_ms)
+
+    def _cancel(self, tier: int, client_key: str, fut: asyncio.Future) -> bool:
+        """Remove a waiter that is still queued. False if it was already granted."""
+        if fut.done():
+            return False
+        fut.cancel()
+        waiters = self._queues[tier].get(client_key)
+        if waiters is not None:
+            try:
+                waiters.remove(fut)
+                self._depth -= 1
+            except ValueError:
+                pass
+            if not waiters:
+                del self._queues[tier][client_key]
+        return True
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Pop the next waiter: weighted pro-first, round-robin across clients."""
+        pro_q, free_q = self._queues[PRO], self._queues[FREE]
+        if pro_q and (not free_q or self._pro_streak < settings.admission_pro_weight):
+            queue = pro_q
+            self._pro_streak += 1
+        elif free_q:
+            queue = free_q
+            self._pro_streak = 0
+        else:
+            return None
+        client_key, waiters = next(iter(queue.items()))
+        fut = waiters.popleft()
+        del queue[client_key]
+        if waiters:
+            queue[client_key] = waiters  # back of the line for this tier
+        self._depth -= 1
+        return fut
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued waiters."""
+        while self.active < self.capacity:
+            fut = self._next_waiter()
+            if fut is None:
+                return
+            if not fut.done():
+                self.active += 1  # reserved on behalf of the woken waiter
+                fut.set_result(None)
+
+    def record_duration(self, seconds: float) -> None:
+        """Feed a finished stream's duration into the Retry-After estimate."""
+        self._service_s = 0.9 * self._service_s + 0.1 * seconds
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 1)
+
+        return {
+            "active": self.active,
+            "capacity": self.capacity,
+            "queue_depth": self._depth,
+            "queue_depth_pro": sum(len(q) for q in self._queues[PRO].values()),
+            "queue_max": settings.admission_queue_max,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_p50": pct(0.50),
+            "wait_ms_p99": pct(0.99),
+            "avg_stream_seconds": round(self._service_s, 2),
+        }
+
+
+admission = AdmissionController()
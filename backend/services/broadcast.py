@@ -0,0 +1,98 @@
+"""Fan-out of one upstream chat stream to several clients.
+
+Identical chat requests that are in flight at the same time (retries,
+double submits, the same canned prompt from many users) share a single
+Ollama generation. The first request starts a ``BroadcastStream``; later
+ones subscribe to it. Every event is kept until the stream ends, so a late
+subscriber first gets everything produced so far and then follows live.
+
+The upstream source runs in its own task, independent of any one client.
+It is cancelled when the last subscriber leaves, which also aborts the
+Ollama request.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+
+class Subscription:
+    """One client's view of a ``BroadcastStream``. ``close`` is idempotent."""
+
+    def __init__(self, stream: "BroadcastStream"):
+        self._stream = stream
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        stream = self._stream
+        i = 0
+        try:
+            while True:
+                changed = stream._changed
+                items = stream._items
+                while i < len(items):
+                    yield items[i]
+                    i += 1
+                if stream.finished:
+                    if stream._error is not None:
+                        raise stream._error
+                    return
+                await changed.wait()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stream._unsubscribe()
+
+
+class BroadcastStream:
+    """Runs ``source`` once and replays its items to every subscriber."""
+
+    def __init__(self, source: AsyncIterator[Any], on_finish: Optional[Callable[[], None]] = None):
+        self._source = source
+        self._on_finish = on_finish
+        self._items: List[Any] = []
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self.finished = False
+        self.joined = 0  # subscribers after the first one
+        self._task = asyncio.create_task(self._produce())
+        # A done callback also runs if the task is cancelled before it starts.
+        self._task.add_done_callback(self._finish)
+
+    async def _produce(self) -> None:
+        async for item in self._source:
+            self._items.append(item)
+            self._notify()
+
+    def _finish(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            self._error = ConnectionAbortedError("broadcast cancelled")
+        elif task.exception() is not None:
+            self._error = task.exception()
+        self.finished = True
+        self._notify()
+        if self._on_finish is not None:
+            self._on_finish()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def subscribe(self) -> Subscription:
+        """Attach a subscriber; it counts as present from this call on."""
+        if self._subscribers > 0 or self._items:
+            self.joined += 1
+        self._subscribers += 1
+        return Subscription(self)
+
+    def _unsubscribe(self) -> None:
+        self._subscribers -= 1
+        if self._subscribers <= 0 and not self._task.done():
+            self._task.cancel()
+
+    async def abandoned(self) -> bool:
+        """True once no subscriber is left (for the upstream disconnect watcher)."""
+        return self._subscribers <= 0
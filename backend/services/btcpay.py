@@ -0,0 +1,76 @@
+"""BTCPay Server API service (Greenfield API).
+
+Handles invoice creation and lookup.
+Docs: https://docs.btcpayserver.org/API/Greenfield/v1/
+"""
+
+import httpx
+
+from config.settings import settings
+from services.gateway import GatewayClient, GatewayError
+
+
+class BTCPayClient(GatewayClient):
+    """BTCPay Server over the shared gateway pool (see services/gateway.py)."""
+
+    name = "BTCPay"
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.btcpay_url and settings.btcpay_store_id)
+
+    def _url(self, path: str) -> str:
+        return f"{settings.btcpay_url.rstrip('/')}/api/v1/stores/{settings.btcpay_store_id}{path}"
+
+    def _headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"token {settings.btcpay_api_key}",
+        }
+
+    async def create_payment(
+        self,
+        price_usd: float,
+        pay_currency: str,
+        order_id: str,
+        order_description: str,
+        ipn_callback_url: str,
+    ) -> dict:
+        """Create an invoice; the buyer picks the coin on BTCPay's checkout page."""
+        payload = {
+            "amount": price_usd,
+            "currency": "USD",
+            "metadata": {"orderId": order_id, "itemDesc": order_description},
+        }
+        try:
+            resp = await self.request(
+                "POST", "/invoices", timeout=settings.gateway_timeout_create, json=payload
+            )
+        except httpx.HTTPStatusError as e:
+            raise GatewayError(f"BTCPay error: {e.response.status_code}")
+        except httpx.HTTPError as e:
+            raise GatewayError(f"BTCPay error: {e!r}")
+
+        data = resp.json()
+        invoice_id = data.get("id")
+        checkout = data.get("checkoutLink") or (
+            f"{settings.btcpay_url}/i/{invoice_id}" if invoice_id else ""
+        )
+        return {
+            "gateway": "btcpay",
+            "payment_id": invoice_id,
+            "pay_address": "",
+            "pay_amount": price_usd,
+            "pay_currency": "USD",
+            "payment_url": checkout,
+            "order_id": order_id,
+            "payment_status": "new",
+        }
+
+    async def get_invoice(self, invoice_id: str) -> dict:
+        """Fetch one invoice (status, amounts, metadata)."""
+        resp = await self.request("GET", f"/invoices/{invoice_id}", timeout=settings.gateway_timeout_status)
+        return resp.json()
+
+
+btcpay = BTCPayClient()
@@ -0,0 +1,285 @@
+"""Fit chat history into the model's context window.
+
+Long conversations eventually exceed the model's context. Ollama then cuts
+the prompt on its own, oldest tokens first, which can drop the system
+prompt, and it has already spent time on the tokens it throws away.
+Instead, ``fit`` trims the history before it is sent:
+
+- Token counts come from a fast estimate (``estimate_tokens``), cached per
+  message so each turn of a conversation is counted only once.
+- The budget is CONTEXT_MAX_TOKENS_BY_MODEL for the model, else
+  CONTEXT_MAX_TOKENS, else the model's num_ctx, minus CONTEXT_RESERVE_TOKENS
+  for the reply.
+- System messages and the newest message are always kept. Older turns are
+  dropped oldest first, so what remains is always the recent tail.
+- Trimming goes down to CONTEXT_TRIM_TO of the budget, and the same cut is
+  reused for a conversation while its tail still fits. The prompt then
+  starts the same way for several turns, so Ollama can reuse its KV cache
+  instead of re-reading the whole history after every turn.
+
+With CONTEXT_SUMMARY=1, dropped turns are replaced by a short summary. The
+summary is made in the background, through the admission queue like any
+other generation, and cached under a hash of the turns it covers. A request
+never waits for it: it uses the longest summary that is ready and schedules
+one that also covers the newly dropped turns (a rolling summary).
+"""
+
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+from services.admission import AdmissionRejected, admission
+from services.ollama import chat_payload, stream_ollama_chat
+from services.ollama_pool import model_key, per_model
+from utils.cache import MISSING, TTLCache
+
+# Role markers and separators Ollama's chat templates add to every message
+MESSAGE_OVERHEAD = 4
+
+_WORD = re.compile(r"[A-Za-z]+")
+_WORD_TAIL = re.compile(r"(?<=[A-Za-z])[A-Za-z]{6}")  # one more token per 6 letters
+_NUMBER = re.compile(r"[0-9]{1,3}")
+_OTHER = re.compile(r"[^\sA-Za-z0-9]")  # punctuation, symbols, non-ASCII
+
+SUMMARY_CLIENT = "context-summary"
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences. Keep names, facts, "
+    "decisions and open questions. Reply with the summary only."
+)
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the token count of ``text`` for a typical BPE tokenizer.
+
+    Words count one token per 6 letters (short words are one token), numbers
+    one per 3 digits, and every other non-space character one each, which
+    slightly overestimates accented and CJK text. Newlines count one each.
+    All counting is done by the regex engine, without a Python-level loop.
+    """
+    return (
+        len(_WORD.findall(text))
+        + len(_WORD_TAIL.findall(text))
+        + len(_NUMBER.findall(text))
+        + len(_OTHER.findall(text))
+        + text.count("\n")
+    )
+
+
+def _prefix_keys(messages: List[dict]) -> List[str]:
+    """Chained hashes: the i-th key identifies ``messages[0..i]``."""
+    h = hashlib.sha256()
+    keys = []
+    for m in messages:
+        h.update(m.get("role", "").encode() + b"\0" + (m.get("content") or "").encode() + b"\0")
+        keys.append(h.hexdigest())
+    return keys
+
+
+async def _never_disconnected() -> bool:
+    return False
+
+
+class ContextWindow:
+    """Trims message lists to a per-model token budget."""
+
+    def __init__(self):
+        # Keyed by hash((role, content)); a rare collision only skews an estimate.
+        self._tokens = TTLCache(settings.context_token_cache_size, 3600)
+        self._summaries = TTLCache(settings.context_summary_cache_size, settings.context_summary_ttl)
+        self._pending: Dict[str, asyncio.Task] = {}
+        # Conversation -> (cut index, hash of the turns dropped there)
+        self._cuts = TTLCache(settings.context_token_cache_size, 3600)
+        self.trimmed = 0
+        self.dropped = 0
+        self.summaries_used = 0
+        self.summaries_made = 0
+        self.summary_errors = 0
+
+    def budget(self, model: str) -> int:
+        """Prompt tokens allowed for ``model``; 0 means no limit."""
+        total = per_model(settings.context_max_tokens_by_model, model, settings.context_max_tokens)
+        if total <= 0:
+            total = per_model(settings.ollama_num_ctx_by_model, model, settings.ollama_num_ctx)
+        if total <= 0:
+            return 0
+        budget = total - settings.context_reserve_tokens
+        if settings.context_summary:
+            budget -= settings.context_summary_max_tokens + MESSAGE_OVERHEAD
+        return max(budget, 1)
+
+    def message_tokens(self, message: dict) -> int:
+        content = message.get("content") or ""
+        key = hash((message.get("role", ""), content))
+        tokens = self._tokens.get(key)
+        if tokens is MISSING:
+            tokens = MESSAGE_OVERHEAD + estimate_tokens(content)
+            self._tokens.set(key, tokens)
+        return tokens
+
+    def fit(self, model: str, messages: List[dict]) -> Tuple[List[dict], int]:
+        """Return (messages that fit the budget, number of messages dropped)."""
+        budget = self.budget(model)
+        if budget <= 0 or len(messages) <= 1:
+            return messages, 0
+        costs = [self.message_tokens(m) for m in messages]
+        if sum(costs) <= budget:
+            return messages, 0
+
+        system = [m.get("role") == "system" for m in messages]
+        system_cost = sum(c for c, s in zip(costs, system) if s)
+        conversation = self._conversation_key(model, messages, system)
+
+        # Keep the previous cut while the rest still fits, so the prompt
+        # prefix (and Ollama's KV cache of it) stays the same across turns.
+        cut, keys = None, []
+        previous = self._cuts.get(conversation)
+        if previous is not MISSING and previous[0] < len(messages):
+            at, digest = previous
+            tail = sum(c for c, s in zip(costs[at:], system[at:]) if not s)
+            if system_cost + tail <= budget:
+                keys = _prefix_keys([m for m, s in zip(messages[:at], system) if not s])
+                if keys and keys[-1] == digest:
+                    cut = at
+        if cut is None:
+            cut = self._find_cut(costs, system, system_cost, int(budget * settings.context_trim_to))
+            keys = _prefix_keys([m for m, s in zip(messages[:cut], system) if not s])
+            if keys:
+                self._cuts.set(conversation, (cut, keys[-1]))
+
+        dropped = [m for m, s in zip(messages[:cut], system) if not s]
+        if not dropped:
+            return messages, 0
+        self.trimmed += 1
+        self.dropped += len(dropped)
+
+        kept = [m for m, s in zip(messages[:cut], system) if s] + messages[cut:]
+        if settings.context_summary:
+            summary = self._summary_for(model, dropped, keys)
+            if summary is not None:
+                # Right after the leading system prompts
+                at = 0
+                while at < len(kept) and kept[at].get("role") == "system":
+                    at += 1
+                kept.insert(at, {"role": "system", "content": SUMMARY_PREFIX + summary})
+        return kept, len(dropped)
+
+    @staticmethod
+    def _find_cut(costs: List[int], system: List[bool], used: int, target: int) -> int:
+        """Index of the oldest non-system message to keep for ``target`` tokens.
+
+        Walks back from the newest message, which is always kept, and stops
+        at the first message that doesn't fit.
+        """
+        cut = len(costs) - 1
+        used += 0 if system[cut] else costs[cut]
+        while cut > 0:
+            i = cut - 1
+            if not system[i]:
+                if used + costs[i] > target:
+                    break
+                used += costs[i]
+            cut = i
+        return cut
+
+    @staticmethod
+    def _conversation_key(model: str, messages: List[dict], system: List[bool]) -> int:
+        """Identify a conversation by its model and first non-system message."""
+        for m, s in zip(messages, system):
+            if not s:
+                return hash((model_key(model), m.get("role", ""), m.get("content") or ""))
+        return hash(model_key(model))
+
+    # --- Rolling summary ---
+
+    def _summary_for(self, model: str, dropped: List[dict], keys: List[str]) -> Optional[str]:
+        """Best ready summary of ``dropped``; schedules a better one if needed.
+
+        ``keys`` are the chained hashes of ``dropped`` (see ``_prefix_keys``).
+        """
+        covered, summary = -1, None
+        for i in range(len(keys) - 1, -1, -1):
+            hit = self._summaries.get(keys[i])
+            if hit is not MISSING:
+                covered, summary = i, hit
+                break
+        if covered < len(keys) - 1 and keys[-1] not in self._pending:
+            self._pending[keys[-1]] = asyncio.create_task(
+                self._summarize(keys[-1], model, summary, dropped[covered + 1:])
+            )
+        if summary is not None:
+            self.summaries_used += 1
+        return summary
+
+    async def _summarize(
+        self, key: str, model: str, previous: Optional[str], turns: List[dict]
+    ) -> None:
+        # Only as much of the transcript as fits the summary model's budget
+        budget = self.budget(model) or 4096
+        lines: List[str] = []
+        used = estimate_tokens(previous) if previous else 0
+        for m in reversed(turns):
+            used += self.message_tokens(m)
+            if lines and used > budget:
+                break
+            lines.append(f"{m.get('role', '')}: {m.get('content') or ''}")
+        lines.reverse()
+        if previous:
+            lines.insert(0, f"(earlier) {previous}")
+
+        try:
+            lease = await admission.acquire(SUMMARY_CLIENT)
+        except AdmissionRejected:
+            self.summary_errors += 1
+            self._pending.pop(key, None)
+            return
+        try:
+            payload = chat_payload(
+                settings.context_summary_model or model,
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": "\n\n".join(lines)},
+                ],
+                {"num_predict": settings.context_summary_max_tokens, "temperature": 0},
+            )
+            parts = [chunk async for chunk in stream_ollama_chat(payload, _never_disconnected, user_chat=False)]
+            summary = b"".join(parts).decode("utf-8").strip()
+            if summary:
+                self._summaries.set(key, summary)
+                self.summaries_made += 1
+        except Exception as e:
+            self.summary_errors += 1
+            print(f"Context window: summary failed: {e}")
+        finally:
+            lease.release()
+            self._pending.pop(key, None)
+
+    async def stop(self) -> None:
+        """Cancel summaries still running (at shutdown)."""
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "default_max_tokens": settings.context_max_tokens,
+            "max_tokens_by_model": settings.context_max_tokens_by_model,
+            "trimmed_requests": self.trimmed,
+            "dropped_messages": self.dropped,
+            "token_cache": self._tokens.stats(),
+            "summary": {
+                "enabled": settings.context_summary,
+                "cached": len(self._summaries),
+                "pending": len(self._pending),
+                "used": self.summaries_used,
+                "made": self.summaries_made,
+                "errors": self.summary_errors,
+            },
+        }
+
+
+context_window = ContextWindow()
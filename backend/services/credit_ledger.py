@@ -0,0 +1,258 @@
+"""Redis write-behind ledger for pro-token credits.
+
+With CREDIT_LEDGER_REDIS=1, the hot ``credits_left`` counters live in Redis:
+
+- ``void:credits:{token_hash}`` holds the live balance and is decremented by
+  ``CREDIT_DEBIT_LUA`` — one round trip per chat instead of a SQLite commit.
+- Every debit is also counted in the ``void:credits:delta`` hash.
+- A background task periodically renames that hash to
+  ``void:credits:inflight:{batch_id}`` (atomic), applies it to SQLite in one
+  transaction that also records the batch ID in ``ledger_batches``, then
+  deletes it.
+
+Crash safety: if the process dies between the rename and the delete, the
+inflight hash survives in Redis and is replayed on the next start. The
+``ledger_batches`` primary key makes replaying an already applied batch a
+no-op. Debits not yet flushed are lost only if Redis itself loses data, so
+run Redis with AOF persistence when this is enabled.
+"""
+
+import asyncio
+import sqlite3
+import time
+import uuid
+from typing import Dict, Optional
+
+from config.settings import settings
+from db.sqlite import run_db
+from state.redis_state import get_redis
+from utils.redis_scripts import LuaScript
+
+BALANCE_KEY = "void:credits:{}"
+DELTA_KEY = "void:credits:delta"
+INFLIGHT_KEY = "void:credits:inflight:{}"
+BATCH_ID_RETENTION = 7 * 86400
+
+# Atomically spends one credit and records the pending debit.
+# Returns the new balance, -1 if exhausted, or -2 if the balance isn't cached.
+CREDIT_DEBIT_LUA = """
+local bal = redis.call('GET', KEYS[1])
+if not bal then
+  return -2
+end
+bal = tonumber(bal)
+if bal <= 0 then
+  return -1
+end
+redis.call('DECR', KEYS[1])
+redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+return bal - 1
+"""
+
+# Loads a balance from SQLite into Redis unless another request beat us to it.
+# Pending (unflushed) debits are subtracted so they aren't handed out twice.
+CREDIT_LOAD_LUA = """
+local pending = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('SET', KEYS[1], tonumber(ARGV[2]) - pending, 'NX')
+return tonumber(redis.call('GET', KEYS[1]))
+"""
+
+# Gives back one credit spent by CREDIT_DEBIT_LUA. The negative delta is
+# flushed like a debit, so it also reaches SQLite if the debit already did.
+CREDIT_REFUND_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('INCR', KEYS[1])
+end
+redis.call('HINCRBY', KEYS[2], ARGV[1], -1)
+return 1
+"""
+
+# Moves all pending debits into a batch hash. Returns 0 if there are none.
+CREDIT_CUT_BATCH_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+return 1
+"""
+
+CREDIT_DEBIT_SCRIPT = LuaScript(CREDIT_DEBIT_LUA)
+CREDIT_LOAD_SCRIPT = LuaScript(CREDIT_LOAD_LUA)
+CREDIT_REFUND_SCRIPT = LuaScript(CREDIT_REFUND_LUA)
+CREDIT_CUT_BATCH_SCRIPT = LuaScript(CREDIT_CUT_BATCH_LUA)
+
+
+def _load_balance(conn: sqlite3.Connection, th: str) -> Optional[int]:
+    row = conn.execute(
+        "SELECT credits_left FROM pro_tokens WHERE token_hash = ?", (th,)
+    ).fetchone()
+    return int(row[0]) if row else None
+
+
+def _apply_batch(conn: sqlite3.Connection, batch_id: str, deltas: Dict[str, int]) -> bool:
+    """Apply one batch of debits. False if it was already applied."""
+    now = int(time.time())
+    try:
+        conn.execute(
+            "INSERT INTO ledger_batches(batch_id, applied_at) VALUES (?, ?)",
+            (batch_id, now),
+        )
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return False
+    conn.executemany(
+        "UPDATE pro_tokens SET credits_left = MAX(credits_left - ?, 0) WHERE token_hash = ?",
+        [(n, th) for th, n in deltas.items()],
+    )
+    # Batch IDs only matter until a crashed flush has been replayed
+    conn.execute(
+        "DELETE FROM ledger_batches WHERE applied_at < ?", (now - BATCH_ID_RETENTION,)
+    )
+    conn.commit()
+    return True
+
+
+def _all_balances(conn: sqlite3.Connection) -> list:
+    return conn.execute("SELECT token_hash, credits_left FROM pro_tokens").fetchall()
+
+
+class CreditLedger:
+    """Redis-first credit counters with periodic SQLite reconciliation."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stranded = False  # a batch may be left in Redis by a failed flush
+        self.flushed_batches = 0
+        self.flushed_debits = 0
+
+    @property
+    def active(self) -> bool:
+        return settings.credit_ledger_redis and get_redis() is not None
+
+    async def debit(self, th: str) -> Optional[int]:
+        """Spend one credit. Same return contract as ``credits.debit_credit_sync``."""
+        redis = get_redis()
+        key = BALANCE_KEY.format(th)
+        left = int(await CREDIT_DEBIT_SCRIPT(redis, [key, DELTA_KEY], [th]))
+        if left != -2:
+            return left
+        # Cache miss: load from SQLite and retry once.
+        if await self.load(th) is None:
+            return None
+        left = int(await CREDIT_DEBIT_SCRIPT(redis, [key, DELTA_KEY], [th]))
+        return None if left == -2 else left
+
+    async def refund(self, th: str) -> None:
+        """Give back one credit taken by ``debit``."""
+        await CREDIT_REFUND_SCRIPT(get_redis(), [BALANCE_KEY.format(th), DELTA_KEY], [th])
+
+    async def load(self, th: str) -> Optional[int]:
+        """Make sure a token's balance is cached. None if the token doesn't exist."""
+        balance = await run_db(_load_balance, th)
+        if balance is None:
+            return None
+        redis = get_redis()
+        return int(await CREDIT_LOAD_SCRIPT(
+            redis, [BALANCE_KEY.format(th), DELTA_KEY], [th, balance]
+        ))
+
+    async def balance(self, th: str) -> Optional[int]:
+        """Current balance (Redis first, loaded from SQLite on a miss)."""
+        cached = await get_redis().get(BALANCE_KEY.format(th))
+        if cached is not None:
+            return int(cached)
+        return await self.load(th)
+
+    async def _apply_inflight(self, key: str) -> None:
+        redis = get_redis()
+        raw = await redis.hgetall(key)
+        if raw:
+            deltas = {th: int(n) for th, n in raw.items()}
+            batch_id = key.rsplit(":", 1)[1]
+            if await run_db(_apply_batch, batch_id, deltas):
+                self.flushed_batches += 1
+                self.flushed_debits += sum(deltas.values())
+        await redis.delete(key)
+
+    async def flush(self) -> None:
+        """Write pending debits through to SQLite."""
+        key = INFLIGHT_KEY.format(uuid.uuid4().hex)
+        if int(await CREDIT_CUT_BATCH_SCRIPT(get_redis(), [DELTA_KEY, key])):
+            await self._apply_inflight(key)
+
+    async def replay(self) -> None:
+        """Apply batches left behind by a crash between cut and delete."""
+        async for key in get_redis().scan_iter(match=INFLIGHT_KEY.format("*")):
+            print(f"Credit ledger: replaying {key}")
+            await self._apply_inflight(key)
+
+    async def warm(self) -> None:
+        """Cache every balance that isn't cached yet."""
+        redis = get_redis()
+        rows = await run_db(_all_balances)
+        # Pipelined EVALSHA has no per-call NOSCRIPT retry, so load it first
+        await redis.script_load(CREDIT_LOAD_SCRIPT.source)
+        async with redis.pipeline(transaction=False) as pipe:
+            for th, left in rows:
+                pipe.evalsha(CREDIT_LOAD_SCRIPT.sha, 2, BALANCE_KEY.format(th), DELTA_KEY, th, left)
+            await pipe.execute()
+        print(f"Credit ledger: warmed {len(rows)} balances")
+
+    async def _sync(self) -> None:
+        if self._stranded:
+            # A failed flush leaves its batch in Redis; pick it up.
+            await self.replay()
+            self._stranded = False
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.credit_flush_interval)
+            try:
+                await self._sync()
+            except Exception as e:
+                self._stranded = True
+                print(f"Credit ledger flush failed: {e}")
+
+    async def start(self) -> None:
+        """Replay, flush and warm, then start the periodic flush (startup).
+
+        The flush loop is started even if the first sync fails, so debits
+        taken in Redis always reach SQLite once it recovers.
+        """
+        if not self.active:
+            return
+        self._stranded = True
+        try:
+            await self._sync()
+            await self.warm()
+        except Exception as e:
+            self._stranded = True
+            print(f"Credit ledger: startup sync failed, retrying in the background: {e}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write everything through (shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if not self.active:
+            return
+        try:
+            await self._sync()
+        except Exception as e:
+            print(f"Credit ledger final flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.active,
+            "flushed_batches": self.flushed_batches,
+            "flushed_debits": self.flushed_debits,
+        }
+
+
+credit_ledger = CreditLedger()
@@ -0,0 +1,150 @@
+"""Pro-token credit accounting.
+
+Balances live in SQLite. With CREDIT_LEDGER_REDIS=1 the hot path goes through
+the Redis write-behind ledger instead (see ``services/credit_ledger.py``).
+While Redis errors, debits fail with ``CreditsUnavailable`` rather than going
+to SQLite: the Redis balances would never see those debits, so the credits
+could be spent again once Redis is back.
+
+Recent lookups are cached in-process per token hash. Unknown tokens are
+cached separately so repeated guesses are answered with 401 without touching
+the database, and can't push real tokens out of the cache. Exhausted tokens
+are cached too; live balances are only used to answer /pro/status polls.
+Debits always go to the database.
+"""
+
+import sqlite3
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from config.settings import settings
+from db.sqlite import run_db
+from services.credit_ledger import credit_ledger
+from utils.cache import MISSING, TTLCache
+
+# UPDATE ... RETURNING needs SQLite 3.35+ (Python builds often ship older).
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+_DEBIT_RETURNING = (
+    "UPDATE pro_tokens SET credits_left = credits_left - 1 "
+    "WHERE token_hash = ? AND credits_left > 0 RETURNING credits_left"
+)
+_DEBIT = (
+    "UPDATE pro_tokens SET credits_left = credits_left - 1 "
+    "WHERE token_hash = ? AND credits_left > 0"
+)
+_BALANCE = "SELECT credits_left FROM pro_tokens WHERE token_hash = ?"
+
+
+class CreditsUnavailable(Exception):
+    """The credit ledger can't be reached; the request should be retried later."""
+
+
+# token_hash -> last known balance
+balance_cache = TTLCache(settings.token_cache_size, settings.token_cache_ttl)
+# token_hash -> True for tokens that don't exist
+invalid_cache = TTLCache(settings.token_invalid_cache_size, settings.token_invalid_cache_ttl)
+
+
+def debit_credit_sync(conn: sqlite3.Connection, th: str) -> Optional[int]:
+    """Atomically spend one credit of a pro token.
+
+    The ``credits_left > 0`` guard lives in the UPDATE itself, so concurrent
+    requests can never drive a balance below zero. Returns the credits left
+    after the debit, -1 if the token has no credits left, or None if the
+    token doesn't exist.
+    """
+    if HAS_RETURNING:
+        rows = conn.execute(_DEBIT_RETURNING, (th,)).fetchall()
+    else:
+        # Fallback: the UPDATE takes the write lock, so reading the new
+        # balance before COMMIT still sees exactly our own decrement.
+        cur = conn.execute(_DEBIT, (th,))
+        rows = conn.execute(_BALANCE, (th,)).fetchall() if cur.rowcount else []
+    conn.commit()
+    if rows:
+        return int(rows[0][0])
+
+    # Rare path: tell an exhausted token apart from an unknown one.
+    row = conn.execute(_BALANCE, (th,)).fetchone()
+    return -1 if row else None
+
+
+def refund_credit_sync(conn: sqlite3.Connection, th: str) -> None:
+    conn.execute("UPDATE pro_tokens SET credits_left = credits_left + 1 WHERE token_hash = ?", (th,))
+    conn.commit()
+
+
+def get_credits_sync(conn: sqlite3.Connection, th: str) -> Optional[int]:
+    row = conn.execute(_BALANCE, (th,)).fetchone()
+    return int(row[0]) if row else None
+
+
+def _remember(th: str, left: Optional[int]) -> None:
+    if left is None:
+        invalid_cache.set(th, True)
+    else:
+        balance_cache.set(th, max(left, 0))
+
+
+def invalidate_token(th: str) -> None:
+    """Forget cached state for a token (call when its credits change out of band)."""
+    balance_cache.pop(th)
+    invalid_cache.pop(th)
+
+
+async def debit_credit(th: str) -> Optional[int]:
+    """Spend one credit off the event loop. See ``debit_credit_sync``."""
+    if invalid_cache.get(th) is True:
+        return None
+    if balance_cache.get(th) == 0:
+        return -1
+
+    if credit_ledger.active:
+        try:
+            left = await credit_ledger.debit(th)
+        except RedisError as e:
+            print(f"Credit ledger unavailable, refusing debit: {e}")
+            raise CreditsUnavailable() from e
+    else:
+        left = await run_db(debit_credit_sync, th)
+    _remember(th, left)
+    return left
+
+
+async def refund_credit(th: str) -> None:
+    """Give back a credit spent on a request that was never served."""
+    if credit_ledger.active:
+        try:
+            await credit_ledger.refund(th)
+        except RedisError as e:
+            print(f"Credit ledger unavailable, could not refund credit: {e}")
+            return
+    else:
+        await run_db(refund_credit_sync, th)
+    balance_cache.pop(th)
+
+
+async def get_credits(th: str) -> Optional[int]:
+    """Current balance of a pro token, or None if it doesn't exist."""
+    if invalid_cache.get(th) is True:
+        return None
+    cached = balance_cache.get(th)
+    if cached is not MISSING:
+        return cached
+
+    if credit_ledger.active:
+        try:
+            left = await credit_ledger.balance(th)
+        except RedisError as e:
+            print(f"Credit ledger unavailable, reading SQLite: {e}")
+            left = await run_db(get_credits_sync, th)
+    else:
+        left = await run_db(get_credits_sync, th)
+    _remember(th, left)
+    return left
+
+
+def cache_stats() -> dict:
+    return {"balances": balance_cache.stats(), "invalid": invalid_cache.stats()}
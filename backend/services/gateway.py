@@ -0,0 +1,217 @@
+"""Payment gateway clients — shared HTTP pool, retries and a circuit breaker.
+
+``NOWPaymentsClient`` (services/nowpayments.py) and ``BTCPayClient``
+(services/btcpay.py) implement ``GatewayClient``. All gateway calls go
+through one long-lived ``httpx.AsyncClient``, so checkouts reuse warm TLS
+connections instead of opening a new session per request.
+
+- Every endpoint has its own timeout (GATEWAY_TIMEOUT_*).
+- Idempotent calls (GET) are retried up to GATEWAY_RETRIES times on
+  transport errors, 429 and 5xx, with jittered exponential backoff. Calls
+  that create something are only retried when the connection could not be
+  opened at all, so the gateway never saw them.
+- After GATEWAY_BREAKER_FAILURES consecutive failures a gateway's breaker
+  opens: calls fail at once with ``GatewayUnavailable`` for
+  GATEWAY_BREAKER_RESET seconds, then one trial call is let through.
+"""
+
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import httpx
+
+from config.settings import settings
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_gateway_http() -> httpx.AsyncClient:
+    """Return the shared gateway HTTP client, creating it lazily."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.gateway_max_connections,
+                max_keepalive_connections=settings.gateway_max_connections,
+                keepalive_expiry=60,
+            ),
+            timeout=settings.gateway_timeout_create,
+        )
+    return _client
+
+
+async def close_gateway_http() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class GatewayError(Exception):
+    """A gateway call failed; ``detail`` is safe to show to the client."""
+
+    def __init__(self, detail: str, status_code: int = 502, retry_after: int = 0):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class GatewayUnavailable(GatewayError):
+    """The gateway's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures, for ``reset_after`` seconds."""
+
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            # Let one trial call through; the next ones wait for its result.
+            self.opened_at = time.monotonic()
+            return True
+        return state == "closed"
+
+    def retry_after(self) -> int:
+        return max(1, int(self.reset_after - (time.monotonic() - self.opened_at)) + 1)
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures == self.threshold:
+            self.trips += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+def _retryable(error: Exception, idempotent: bool) -> bool:
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True  # never reached the gateway
+    if not idempotent:
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class GatewayClient(ABC):
+    """Base class: one payment gateway behind the shared pool and a breaker."""
+
+    name = ""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(settings.gateway_breaker_failures, settings.gateway_breaker_reset)
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+
+    @property
+    @abstractmethod
+    def configured(self) -> bool:
+        """True if the gateway's credentials are set."""
+
+    @abstractmethod
+    def _url(self, path: str) -> str:
+        """Absolute URL of an API path."""
+
+    @abstractmethod
+    def _headers(self) -> dict:
+        """Headers sent with every call (auth, content type)."""
+
+    @abstractmethod
+    async def create_payment(
+        self,
+        price_usd: float,
+        pay_currency: str,
+        order_id: str,
+        order_description: str,
+        ipn_callback_url: str,
+    ) -> dict:
+        """Start a checkout. Returns the body sent by ``POST /create-payment``."""
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        timeout: float,
+        idempotent: Optional[bool] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """Send one call with retries and breaker accounting.
+
+        Raises ``GatewayUnavailable`` while the breaker is open, otherwise the
+        last ``httpx`` error once retries are used up.
+        """
+        if idempotent is None:
+            idempotent = method.upper() == "GET"
+        if not self.breaker.allow():
+            raise GatewayUnavailable(
+                f"{self.name} is unavailable, try again shortly",
+                status_code=503,
+                retry_after=self.breaker.retry_after(),
+            )
+        client = get_gateway_http()
+        attempt = 0
+        while True:
+            self.calls += 1
+            try:
+                resp = await client.request(
+                    method, self._url(path), headers=self._headers(), timeout=timeout, **kwargs
+                )
+                resp.raise_for_status()
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                # 4xx means the gateway is up and answered; only the rest trips the breaker.
+                server_side = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if attempt < settings.gateway_retries and _retryable(e, idempotent):
+                    attempt += 1
+                    self.retries += 1
+                    backoff = settings.gateway_retry_backoff_ms / 1000 * (2 ** (attempt - 1))
+                    await asyncio.sleep(random.uniform(0, backoff))
+                    continue
+                self.errors += 1
+                if server_side:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return resp
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "calls": self.calls,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+def get_gateway() -> Optional[GatewayClient]:
+    """The configured gateway (PAYMENT_GATEWAY), or None if it lacks credentials."""
+    from services.btcpay import btcpay
+    from services.nowpayments import nowpayments
+
+    gateway = {"nowpayments": nowpayments, "btcpay": btcpay}.get(settings.payment_gateway)
+    return gateway if gateway is not None and gateway.configured else None
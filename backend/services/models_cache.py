@@ -0,0 +1,89 @@
+"""In-process cache of the model list served by ``GET /models``.
+
+Listing models probes every backend (``/api/tags``), which can take seconds
+while Ollama is busy loading a model. The list is cached:
+
+- younger than MODELS_CACHE_TTL: served as is;
+- older, but younger than MODELS_CACHE_STALE: served as is while one
+  background task refreshes it (stale-while-revalidate);
+- older than that, or never fetched: the caller waits for a refresh.
+
+An empty list (no backend reachable) counts as stale right away.
+
+Concurrent refreshes are collapsed into one. ``invalidate`` drops the list,
+e.g. after the AI URL changed.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Optional, Tuple
+
+from config.settings import settings
+from services.ollama import fetch_ollama_models
+
+
+class ModelsCache:
+    """Stale-while-revalidate holder for the ``fetch_ollama_models`` result."""
+
+    def __init__(self):
+        self._value: Optional[dict] = None
+        self._etag = ""
+        self._fetched_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+        self._generation = 0  # bumped by invalidate, so late refreshes are dropped
+        self.hits = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+
+    async def get(self) -> Tuple[dict, str]:
+        """Return (model list, ETag)."""
+        while True:
+            age = time.monotonic() - self._fetched_at
+            if self._value is not None:
+                if age < settings.models_cache_ttl:
+                    self.hits += 1
+                    return self._value, self._etag
+                if age < settings.models_cache_stale:
+                    self.stale_hits += 1
+                    self._start_refresh()
+                    return self._value, self._etag
+            await asyncio.shield(self._start_refresh())
+            # Loop in case invalidate() ran while we waited.
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._do_refresh(self._generation))
+        return self._refresh
+
+    async def _do_refresh(self, generation: int) -> None:
+        self.refreshes += 1
+        value = await fetch_ollama_models()
+        if generation != self._generation:
+            return
+        body = json.dumps(value, sort_keys=True).encode()
+        self._value = value
+        self._etag = f'W/"{hashlib.sha1(body).hexdigest()[:16]}"'
+        self._fetched_at = time.monotonic()
+        if not value["models"]:
+            # Nothing reachable: serve it, but refresh on the next request.
+            self._fetched_at -= settings.models_cache_ttl
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._value = None
+        self._fetched_at = 0.0
+        self._refresh = None
+
+    def stats(self) -> dict:
+        return {
+            "cached": self._value is not None,
+            "age_s": round(time.monotonic() - self._fetched_at, 1) if self._value else None,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+        }
+
+
+models_cache = ModelsCache()
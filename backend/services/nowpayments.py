@@ -7,83 +7,105 @@ Docs: https://documenter.getpostman.com/view/7907941/2s93JusNJt
 import httpx
 
 from config.settings import settings
+from services.gateway import GatewayClient, GatewayError
 
 BASE_URL = "https://api.nowpayments.io/v1"
-HEADERS = {"x-api-key": settings.nowpayments_api_key, "Content-Type": "application/json"}
-
-
-async def create_payment(
-    price_amount: float,
-    price_currency: str,
-    pay_currency: str,
-    order_id: str,
-    order_description: str,
-    ipn_callback_url: str,
-) -> dict:
-    """Create a new payment on NOWPayments.
-
-    Returns the payment object containing:
-    - payment_id, pay_address, pay_amount, pay_currency
-    - payment_status, payment_url
-    """
-    payload: dict = {
-        "price_amount": price_amount,
-        "price_currency": price_currency,
-        "pay_currency": pay_currency,
-        "order_id": order_id,
-        "order_description": order_description,
-    }
-    if ipn_callback_url:
-        payload["ipn_callback_url"] = ipn_callback_url
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            f"{BASE_URL}/payment",
-            headers=HEADERS,
-            json=payload,
-        )
-        resp.raise_for_status()
-        return resp.json()
 
 
-async def get_payment_status(payment_id: int) -> dict:
-    """Get the status of a specific payment."""
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(
-            f"{BASE_URL}/payment/{payment_id}",
-            headers=HEADERS,
-        )
-        resp.raise_for_status()
-        return resp.json()
+class NOWPaymentsClient(GatewayClient):
+    """NOWPayments over the shared gateway pool (see services/gateway.py)."""
+
+    name = "NOWPayments"
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.nowpayments_api_key)
+
+    def _url(self, path: str) -> str:
+        return f"{BASE_URL}{path}"
+
+    def _headers(self) -> dict:
+        return {"x-api-key": settings.nowpayments_api_key, "Content-Type": "application/json"}
 
+    async def create_payment(
+        self,
+        price_usd: float,
+        pay_currency: str,
+        order_id: str,
+        order_description: str,
+        ipn_callback_url: str,
+    ) -> dict:
+        """Create a new payment on NOWPayments.
 
-async def get_estimated_price(
-    price_amount: float,
-    price_currency: str,
-    pay_currency: str,
-) -> float:
-    """Estimate how much crypto is needed for a given USD amount."""
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(
-            f"{BASE_URL}/estimate",
-            headers=HEADERS,
+        Returns the checkout details: payment_id, pay_address, pay_amount,
+        pay_currency, payment_url, order_id and payment_status.
+        """
+        payload: dict = {
+            "price_amount": price_usd,
+            "price_currency": "usd",
+            "pay_currency": pay_currency,
+            "order_id": order_id,
+            "order_description": order_description,
+        }
+        if ipn_callback_url:
+            payload["ipn_callback_url"] = ipn_callback_url
+
+        try:
+            resp = await self.request(
+                "POST", "/payment", timeout=settings.gateway_timeout_create, json=payload
+            )
+        except httpx.HTTPStatusError as e:
+            error_body = e.response.text[:500]
+            print(f"[NOWPayments] HTTP {e.response.status_code} on order_id={order_id}: {error_body}")
+            raise GatewayError(f"Payment gateway error {e.response.status_code}: {error_body}")
+        except httpx.HTTPError as e:
+            raise GatewayError(f"Payment gateway error: {e!r}")
+
+        result = resp.json()
+        return {
+            "gateway": "nowpayments",
+            "payment_id": result.get("payment_id"),
+            "pay_address": result.get("pay_address"),
+            "pay_amount": result.get("pay_amount"),
+            "pay_currency": result.get("pay_currency"),
+            "payment_url": result.get("payment_url", ""),
+            "order_id": order_id,
+            "payment_status": result.get("payment_status", "waiting"),
+        }
+
+    async def get_payment_status(self, payment_id: int) -> dict:
+        """Get the status of a specific payment."""
+        resp = await self.request("GET", f"/payment/{payment_id}", timeout=settings.gateway_timeout_status)
+        return resp.json()
+
+    async def get_estimated_price(
+        self,
+        price_amount: float,
+        price_currency: str,
+        pay_currency: str,
+    ) -> float:
+        """Estimate how much crypto is needed for a given USD amount."""
+        resp = await self.request(
+            "GET",
+            "/estimate",
+            timeout=settings.gateway_timeout_quote,
             params={
                 "price_amount": price_amount,
                 "price_currency": price_currency,
                 "pay_currency": pay_currency,
             },
         )
-        resp.raise_for_status()
         return float(resp.json().get("estimated_amount", 0))
 
-
-async def get_min_payment_amount(pay_currency: str, price_currency: str = "usd") -> float:
-    """Get minimum payment amount for a currency pair."""
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(
-            f"{BASE_URL}/min-amount/{pay_currency}",
-            headers=HEADERS,
+    async def get_min_payment_amount(self, pay_currency: str, price_currency: str = "usd") -> float:
+        """Get minimum payment amount for a currency pair."""
+        resp = await self.request(
+            "GET",
+            f"/min-amount/{pay_currency}",
+            timeout=settings.gateway_timeout_quote,
             params={"currency": price_currency, "fiat_equivalent": "usd"},
         )
-        resp.raise_for_status()
         return float(resp.json().get("min_amount", 0))
+
+
+nowpayments = NOWPaymentsClient()
@@ -1,50 +1,328 @@
-"""Ollama service — model listing and chat streaming."""
+"""Ollama service — model listing and chat streaming.
+
+All upstream traffic goes through one long-lived, pooled ``httpx.AsyncClient``
+so chat streams reuse keep-alive connections instead of paying a TCP/TLS
+handshake per request. The client is started and closed in ``main.lifespan``
+and rebuilt when the AI URL is changed at runtime.
+"""
+
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Union
+from urllib.parse import urlsplit
 
-import json
 import httpx
 
 from config.settings import settings
+from services.ollama_pool import model_key, ollama_pool, per_model
+from utils.ndjson import LineSplitter, loads, parse_chat_line
 
+_client: Optional[httpx.AsyncClient] = None
+
+# Streams currently using each client, so a retired client is only closed
+# once its last stream has finished.
+_client_leases: Dict[httpx.AsyncClient, int] = {}
+_retired: set = set()
+
+# Per-host connection caps (httpx only limits the pool as a whole).
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional ``h2`` package (``httpx[http2]``)."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Create the pooled upstream client from settings."""
+    http2 = settings.ollama_http2 and _http2_available()
+    if settings.ollama_http2 and not http2:
+        print("WARNING: OLLAMA_HTTP2=1 but the 'h2' package is missing — using HTTP/1.1.")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.ollama_max_connections,
+            max_keepalive_connections=settings.ollama_max_keepalive,
+            keepalive_expiry=settings.ollama_keepalive_expiry,
+        ),
+        # The read timeout is generous because the first byte only arrives
+        # after the model is loaded. Waiting for a pooled connection is bounded
+        # by admission control and the per-host slots instead of a pool timeout.
+        timeout=httpx.Timeout(
+            connect=settings.ollama_connect_timeout,
+            read=settings.ollama_read_timeout,
+            write=30,
+            pool=None,
+        ),
+    )
+
+
+async def start_ollama_client() -> None:
+    """Create the shared upstream client (called from ``main.lifespan``)."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_ollama_client() -> None:
+    """Close the shared client and any retired clients (application shutdown)."""
+    global _client
+    clients = list(_retired)
+    if _client is not None:
+        clients.append(_client)
+    _client = None
+    _retired.clear()
+    _client_leases.clear()
+    _host_slots.clear()
+    for client in clients:
+        await client.aclose()
 
-async def fetch_ollama_models() -> dict:
-    """Fetch available models from the Ollama API.
 
-    Returns a dict with 'models' (list of names) and 'default' (configured model).
-    Falls back to the configured default model if Ollama is unreachable.
+async def rebuild_ollama_client() -> None:
+    """Swap in a fresh client after the AI URL changed.
+
+    Idle keep-alive connections to the old backend are dropped. Streams still
+    running on the old client are left to finish; it is closed after the last one.
+    """
+    global _client
+    old = _client
+    _client = _build_client()
+    _host_slots.clear()
+    if old is None:
+        return
+    if _client_leases.get(old, 0) > 0:
+        _retired.add(old)
+    else:
+        await old.aclose()
+
+
+def get_ollama_client() -> httpx.AsyncClient:
+    """Return the shared upstream client, creating it lazily if needed."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _host_semaphore(url: str) -> Optional[asyncio.Semaphore]:
+    """Return the connection cap for the host of ``url`` (None = unlimited)."""
+    if settings.ollama_max_connections_per_host <= 0:
+        return None
+    host = urlsplit(url).netloc
+    sem = _host_slots.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(settings.ollama_max_connections_per_host)
+        _host_slots[host] = sem
+    return sem
+
+
+@asynccontextmanager
+async def upstream(url: str) -> AsyncIterator[httpx.AsyncClient]:
+    """Borrow the shared client for one request to ``url``.
+
+    Holds a per-host connection slot for the duration of the block and keeps
+    the client alive across a concurrent ``rebuild_ollama_client``.
     """
+    client = get_ollama_client()
+    sem = _host_semaphore(url)
+    _client_leases[client] = _client_leases.get(client, 0) + 1
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            res = await client.get(f"{settings.ollama_base_url}/api/tags")
-            res.raise_for_status()
-            data = res.json()
-            models = [m["name"] for m in data.get("models", [])]
-            return {"models": models, "default": settings.ollama_model}
-    except Exception as e:
-        print(f"Error loading models from Ollama: {e}")
+        if sem is None:
+            yield client
+        else:
+            async with sem:
+                yield client
+    finally:
+        left = _client_leases.get(client, 1) - 1
+        if left > 0:
+            _client_leases[client] = left
+        else:
+            _client_leases.pop(client, None)
+            if client in _retired:
+                _retired.discard(client)
+                await client.aclose()
+
+
+async def fetch_ollama_models() -> dict:
+    """Fetch available models from every Ollama backend in the pool.
+
+    Returns a dict with 'models' (union of model names across healthy
+    backends) and 'default' (configured model). Returns an empty list if no
+    backend is reachable.
+    """
+    # Refreshing here (rather than only in the health loop) keeps /models
+    # accurate right after a model is pulled or a backend comes back.
+    await ollama_pool.probe_all()
+    models = ollama_pool.models()
+    if not models and not any(n.healthy for n in ollama_pool.nodes):
+        print("Error loading models from Ollama: no healthy backend")
         return {"models": [], "default": ""}
+    return {"models": models, "default": settings.ollama_model}
 
 
-async def stream_ollama_chat(payload: dict, is_disconnected):
-    """Stream a chat completion from Ollama.
+class DisconnectWatcher:
+    """Background check for a client disconnect during one chat stream.
 
-    Yields text chunks as raw bytes. Stops if the client disconnects.
+    Polls ``is_disconnected`` every ``disconnect_poll_ms`` instead of once per
+    token. On a disconnect it closes the upstream response, which drops the
+    connection to Ollama so the backend stops generating right away; the
+    pending read then fails and the stream loop ends quietly.
     """
-    async with httpx.AsyncClient(timeout=None) as client:
-        async with client.stream(
-            "POST", f"{settings.ollama_base_url}/api/chat", json=payload
-        ) as r:
-            r.raise_for_status()
-            async for line in r.aiter_lines():
-                if await is_disconnected():
-                    break
-                if not line:
-                    continue
+
+    def __init__(self, is_disconnected):
+        self.gone = False
+        self._response: Optional[httpx.Response] = None
+        self._task = asyncio.create_task(self._run(is_disconnected))
+
+    async def _run(self, is_disconnected) -> None:
+        interval = settings.disconnect_poll_ms / 1000
+        while not await is_disconnected():
+            await asyncio.sleep(interval)
+        self.gone = True
+        if self._response is not None:
+            await self._response.aclose()
+
+    def attach(self, response: httpx.Response) -> None:
+        """Set the upstream response to close on disconnect."""
+        self._response = response
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def model_request_settings(model: str) -> dict:
+    """Per-model request fields: ``keep_alive`` and, when set, ``num_ctx``.
+
+    Returned as ``{"keep_alive": ..., "options": {...}}``; merge the options
+    into the payload's own.
+    """
+    keep_alive = per_model(settings.ollama_keep_alive_by_model, model, settings.ollama_keep_alive)
+    num_ctx = per_model(settings.ollama_num_ctx_by_model, model, settings.ollama_num_ctx)
+    return {"keep_alive": keep_alive, "options": {"num_ctx": num_ctx} if num_ctx > 0 else {}}
+
+
+def chat_payload(model: str, messages: list, options: Optional[dict] = None) -> dict:
+    """Streaming ``/api/chat`` payload with the model's keep_alive and num_ctx."""
+    extra = model_request_settings(model)
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": extra["keep_alive"],
+    }
+    options = {**extra["options"], **(options or {})}
+    if options:
+        payload["options"] = options
+    return payload
+
+
+async def stream_ollama_events(
+    payload: dict, is_disconnected, affinity: Optional[str] = None, user_chat: bool = True
+) -> AsyncIterator[Union[bytes, dict]]:
+    """Stream a chat completion from the least-loaded suitable Ollama backend.
+
+    Yields text chunks as raw bytes, then Ollama's final ``done`` object as a
+    dict (token counts and durations, see ``usage_from_done``) once the body
+    has been read to the end. Stops, and aborts the upstream request, when
+    the client disconnects (see ``DisconnectWatcher``); no ``done`` object is
+    yielded then.
+    If a backend refuses the connection, the request is retried on the next
+    backend (nothing has been sent to the client at that point).
+    ``affinity`` (a hashed client key) keeps a client on the same backend,
+    see ``OllamaPool.pick``. Internal calls pass ``user_chat=False`` so they
+    don't count towards the models kept warm.
+    """
+    from services.warmup import warmup
+
+    model = payload.get("model", "")
+    if user_chat:
+        warmup.record(model)
+    tried: set = set()
+    watcher = DisconnectWatcher(is_disconnected)
+    try:
+        while True:
+            async with ollama_pool.acquire(model, exclude=tried, affinity=affinity) as node:
+                url = f"{node.url}/api/chat"
+                final: Optional[bytes] = None
                 try:
-                    obj = json.loads(line)
-                    chunk = (obj.get("message") or {}).get("content") or ""
-                    if chunk:
-                        yield chunk.encode("utf-8")
-                    if obj.get("done") is True:
-                        break
-                except json.JSONDecodeError:
+                    async with upstream(url) as client:
+                        async with client.stream("POST", url, json=payload) as r:
+                            watcher.attach(r)
+                            if watcher.gone:
+                                return
+                            r.raise_for_status()
+                            # aiter_bytes rather than aiter_raw: same buffers when the
+                            # body isn't compressed, but still correct if a proxy gzips it.
+                            lines = LineSplitter()
+                            async for data in r.aiter_bytes():
+                                for line in lines.feed(data):
+                                    parsed = parse_chat_line(line) if line else None
+                                    if parsed is None:
+                                        continue
+                                    if parsed[0]:
+                                        yield parsed[0]
+                                    if parsed[1]:
+                                        # No break on "done": the body ends right after it, and
+                                        # reading it to the end returns the connection to the pool.
+                                        final = line
+                            tail = lines.flush()
+                            parsed = parse_chat_line(tail) if tail else None
+                            if parsed is not None:
+                                if parsed[0]:
+                                    yield parsed[0]
+                                if parsed[1]:
+                                    final = tail
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    node.mark_failure(f"connect failed: {e!r}")
+                    tried.add(node.url)
+                    if len(tried) >= len(ollama_pool.nodes):
+                        raise
                     continue
+                except (httpx.StreamError, httpx.TransportError):
+                    if watcher.gone:
+                        return  # we closed the response ourselves
+                    raise
+                node.mark_ok()
+                if model:
+                    node.loaded.add(model_key(model))
+            if final is not None:
+                done = loads(final)
+                warmup.observe(done)
+                yield done
+            return
+    finally:
+        await watcher.stop()
+
+
+async def stream_ollama_chat(
+    payload: dict, is_disconnected, affinity: Optional[str] = None, user_chat: bool = True
+) -> AsyncIterator[bytes]:
+    """Like ``stream_ollama_events``, but only the text chunks."""
+    async for event in stream_ollama_events(payload, is_disconnected, affinity, user_chat):
+        if isinstance(event, bytes):
+            yield event
+
+
+def usage_from_done(done: dict) -> dict:
+    """Token counts and timings from Ollama's final ``done`` object.
+
+    Ollama reports durations in nanoseconds; they are returned in milliseconds.
+    """
+    prompt = int(done.get("prompt_eval_count") or 0)
+    completion = int(done.get("eval_count") or 0)
+    eval_ns = int(done.get("eval_duration") or 0)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "total_ms": round(int(done.get("total_duration") or 0) / 1e6, 1),
+        "load_ms": round(int(done.get("load_duration") or 0) / 1e6, 1),
+        "prompt_eval_ms": round(int(done.get("prompt_eval_duration") or 0) / 1e6, 1),
+        "eval_ms": round(eval_ns / 1e6, 1),
+        "tokens_per_second": round(completion / eval_ns * 1e9, 2) if eval_ns else 0.0,
+    }
@@ -0,0 +1,221 @@
+"""Ollama backend pool — health checks and least-in-flight, model-aware routing.
+
+Backends come from ``settings.ollama_base_urls``. A background task probes
+each node's ``/api/tags`` (installed models) and ``/api/ps`` (models loaded in
+memory). Nodes that fail ``ollama_eject_after_failures`` consecutive probes or
+requests are ejected from routing and re-admitted on the next good probe.
+
+Requests with an affinity key (the hashed client ID) go back to the node
+that served that key last, as long as it is still a suitable choice. Ollama
+reuses the KV cache when a prompt starts with the previous one, so a
+conversation that stays on one node skips re-evaluating its history.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional
+
+from config.settings import settings
+from utils.cache import MISSING, TTLCache
+
+
+def model_key(model: str) -> str:
+    """Normalize a model name the way Ollama lists it ("llama3" -> "llama3:latest")."""
+    if model and ":" not in model:
+        return f"{model}:latest"
+    return model
+
+
+def per_model(values: dict, model: str, default: Any) -> Any:
+    """Look up a per-model setting, matching names the way ``model_key`` does."""
+    key = model_key(model)
+    for name, value in values.items():
+        if model_key(name) == key:
+            return value
+    return default
+
+
+class OllamaNode:
+    """One Ollama backend and what we know about it."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True  # optimistic until the first probe says otherwise
+        self.in_flight = 0
+        self.failures = 0
+        self.models: set = set()  # installed (/api/tags)
+        self.loaded: set = set()  # resident in memory (/api/ps)
+        self.last_error = ""
+
+    def mark_ok(self) -> None:
+        if not self.healthy:
+            print(f"Ollama backend {self.url} is healthy again")
+        self.healthy = True
+        self.failures = 0
+        self.last_error = ""
+
+    def mark_failure(self, error: str) -> None:
+        self.failures += 1
+        self.last_error = error
+        if self.healthy and self.failures >= settings.ollama_eject_after_failures:
+            print(f"Ollama backend {self.url} ejected: {error}")
+            self.healthy = False
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "models": sorted(self.models),
+            "loaded": sorted(self.loaded),
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    """Routes requests across the configured Ollama backends."""
+
+    def __init__(self):
+        self.nodes: List[OllamaNode] = []
+        self._task: Optional[asyncio.Task] = None
+        # (affinity key, model) -> URL of the node that served it last
+        self._affinity = TTLCache(settings.ollama_affinity_size, settings.ollama_affinity_ttl)
+        self.affinity_hits = 0
+        self.affinity_moves = 0
+
+    def configure(self, urls: List[str]) -> None:
+        """Set the backend list, keeping state for URLs that stay."""
+        current = {n.url: n for n in self.nodes}
+        self.nodes = [current.get(u.rstrip("/")) or OllamaNode(u) for u in urls]
+
+    def pick(
+        self, model: str, exclude: Optional[set] = None, affinity: Optional[str] = None
+    ) -> Optional[OllamaNode]:
+        """Choose a node for ``model``.
+
+        Only nodes that have the model installed are considered when any do.
+        Among those, the cost is the number of in-flight requests plus a
+        penalty when the model is not already loaded, so warm nodes win
+        unless they are clearly busier than a cold one.
+
+        With an ``affinity`` key, the node that served the key last is kept
+        while it remains a candidate and has a free slot.
+        """
+        model = model_key(model)
+        nodes = [n for n in self.nodes if not exclude or n.url not in exclude]
+        candidates = [n for n in nodes if n.healthy] or nodes
+        if not candidates:
+            return None
+        if model:
+            installed = [n for n in candidates if model in n.models]
+            if installed:
+                candidates = installed
+        # Respect the per-backend concurrency limit while any node has room.
+        limit = settings.ollama_max_concurrency_per_backend
+        free = [n for n in candidates if n.in_flight < limit]
+        if free:
+            candidates = free
+
+        sticky_key = (affinity, model) if affinity and settings.ollama_affinity else None
+        if sticky_key is not None:
+            url = self._affinity.get(sticky_key)
+            if url is not MISSING:
+                for node in candidates:
+                    if node.url == url and node.in_flight < limit:
+                        self.affinity_hits += 1
+                        return node
+                self.affinity_moves += 1
+
+        def cost(node: OllamaNode) -> int:
+            cold = 0 if model and model in node.loaded else settings.ollama_cold_load_penalty
+            return node.in_flight + cold
+
+        node = min(candidates, key=cost)
+        if sticky_key is not None:
+            self._affinity.set(sticky_key, node.url)
+        return node
+
+    @asynccontextmanager
+    async def acquire(
+        self, model: str, exclude: Optional[set] = None, affinity: Optional[str] = None
+    ) -> AsyncIterator[OllamaNode]:
+        """Pick a node and count the request against it while the block runs."""
+        node = self.pick(model, exclude, affinity)
+        if node is None:
+            raise RuntimeError("No Ollama backends configured")
+        node.in_flight += 1
+        try:
+            yield node
+        finally:
+            node.in_flight -= 1
+
+    def models(self) -> List[str]:
+        """Union of models installed on healthy nodes."""
+        names: set = set()
+        for node in self.nodes:
+            if node.healthy:
+                names |= node.models
+        return sorted(names)
+
+    async def probe(self, node: OllamaNode) -> None:
+        """Refresh one node's health and model lists."""
+        from services.ollama import upstream
+
+        tags_url = f"{node.url}/api/tags"
+        ps_url = f"{node.url}/api/ps"
+        try:
+            async with upstream(tags_url) as client:
+                res = await client.get(tags_url, timeout=settings.ollama_health_timeout)
+                res.raise_for_status()
+                node.models = {m["name"] for m in res.json().get("models", [])}
+                # /api/ps is best-effort: older Ollama versions don't have it.
+                try:
+                    res = await client.get(ps_url, timeout=settings.ollama_health_timeout)
+                    if res.status_code == 200:
+                        node.loaded = {m["name"] for m in res.json().get("models", [])}
+                except Exception:
+                    pass
+            node.mark_ok()
+        except Exception as e:
+            node.mark_failure(f"health check failed: {e!r}")
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(self.probe(n) for n in self.nodes))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.ollama_health_interval)
+            try:
+                await self.probe_all()
+            except Exception as e:
+                print(f"Ollama health loop error: {e}")
+
+    async def start(self) -> None:
+        """Load backends from settings, probe once and start the health loop."""
+        self.configure(settings.ollama_base_urls)
+        await self.probe_all()
+        if self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "backends": [n.to_dict() for n in self.nodes],
+            "affinity": {
+                "enabled": settings.ollama_affinity,
+                "clients": len(self._affinity),
+                "hits": self.affinity_hits,
+                "moves": self.affinity_moves,
+            },
+        }
+
+
+ollama_pool = OllamaPool()
@@ -0,0 +1,132 @@
+"""Push notification of completed payments.
+
+The webhook inbox stores each new pro token under
+``void:payment_token:{order_id}`` and publishes it on the channel of the same
+name. Every app process runs one pattern subscription on
+``void:payment_token:*`` and hands the messages to the checkouts waiting in
+that process, so ``GET /pro/payment-events/{order_id}`` costs an idle
+connection per open checkout instead of a Redis GET and a DB query every few
+seconds.
+
+Waiters are registered before the stored token is read, so a token published
+between the two is never missed.
+"""
+
+import asyncio
+from typing import Dict, Optional, Set
+
+from config.settings import settings
+from state.redis_state import get_redis
+
+PAYMENT_TOKEN_KEY = "void:payment_token:{}"
+PAYMENT_TOKEN_PATTERN = PAYMENT_TOKEN_KEY.format("*")
+PAYMENT_TOKEN_TTL = 3600  # the frontend can claim the token for 1h
+RECONNECT_DELAY = 2
+
+
+class PaymentEvents:
+    """One Redis subscription per process, fanned out to waiting checkouts."""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._connected = False
+        self.delivered = 0
+        self.reconnects = 0
+
+    @property
+    def available(self) -> bool:
+        return self._connected
+
+    def subscribe(self, order_id: str) -> asyncio.Future:
+        """Return a future resolved with the token published for ``order_id``."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(order_id, set()).add(future)
+        return future
+
+    def unsubscribe(self, order_id: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(order_id)
+        if waiters is None:
+            return
+        waiters.discard(future)
+        if not waiters:
+            del self._waiters[order_id]
+
+    def _deliver(self, channel: str, token: str) -> None:
+        order_id = channel[len(PAYMENT_TOKEN_KEY.format("")):]
+        for future in self._waiters.pop(order_id, ()):
+            if not future.done():
+                future.set_result(token)
+                self.delivered += 1
+
+    async def _listen(self) -> None:
+        while True:
+            redis = get_redis()
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(PAYMENT_TOKEN_PATTERN)
+                self._connected = True
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "pmessage":
+                        self._deliver(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Payment events: subscription lost: {e}")
+            finally:
+                self._connected = False
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def start(self) -> None:
+        """Subscribe to token notifications (startup, after Redis is connected)."""
+        if not settings.payments_enabled or get_redis() is None:
+            return
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for waiters in self._waiters.values():
+            for future in waiters:
+                future.cancel()
+        self._waiters.clear()
+
+    def stats(self) -> dict:
+        return {
+            "subscribed": self._connected,
+            "waiting": sum(len(w) for w in self._waiters.values()),
+            "delivered": self.delivered,
+            "reconnects": self.reconnects,
+        }
+
+
+async def publish_tokens(tokens: Dict[str, str]) -> bool:
+    """Store and publish new tokens (order ID -> token) in one round trip.
+
+    Returns False if they could not be stored (no Redis, or it errored).
+    """
+    redis = get_redis()
+    if redis is None:
+        return False
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for order_id, token in tokens.items():
+                key = PAYMENT_TOKEN_KEY.format(order_id)
+                pipe.set(key, token, ex=PAYMENT_TOKEN_TTL)
+                pipe.publish(key, token)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Payment events: could not publish tokens for {list(tokens)}: {e}")
+        return False
+    return True
+
+
+payment_events = PaymentEvents()
@@ -0,0 +1,113 @@
+"""In-process cache of the crypto prices shown by ``GET /get-prices``.
+
+Each quote is a NOWPayments ``/estimate`` call, which is slow and counts
+against the API quota. The pricing modal asks for them on every view, so
+they are cached:
+
+- younger than PRICE_CACHE_TTL: served as is;
+- older: served flagged ``"stale": true`` while one background task fetches
+  all currencies at once;
+- older than PRICE_CACHE_MAX_STALE, or never fetched: the caller waits up to
+  PRICE_FETCH_TIMEOUT seconds for a refresh, then gets zeros (the frontend
+  shows "Unable to fetch prices").
+
+Ages are tracked per currency: a currency whose estimate fails keeps its
+previous price, which turns stale and then unusable on its own schedule.
+"""
+
+import asyncio
+import math
+import time
+from typing import Dict, Optional
+
+from config.settings import settings
+from services.nowpayments import nowpayments
+
+# Quote currency code -> key in the /get-prices response
+CURRENCIES = {"btc": "btc_usd", "xmr": "xmr_usd"}
+QUOTE_USD = 10
+
+
+class PriceQuotes:
+    """Stale-while-revalidate holder for USD prices of the payment currencies."""
+
+    def __init__(self):
+        self._prices: Dict[str, float] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._refresh: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.payment_gateway == "nowpayments" and nowpayments.configured
+
+    async def get(self) -> dict:
+        """Return the /get-prices body: a USD price per currency, plus ``stale``."""
+        if not self.enabled:
+            return self._body({})
+        ages = self._ages()
+        if all(age < settings.price_cache_ttl for age in ages.values()):
+            self.hits += 1
+            return self._body(ages)
+        refresh = self._start_refresh()
+        if all(age < settings.price_cache_max_stale for age in ages.values()):
+            self.stale_hits += 1
+            return self._body(ages)
+        try:
+            await asyncio.wait_for(asyncio.shield(refresh), settings.price_fetch_timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._body(self._ages())
+
+    def _ages(self) -> Dict[str, float]:
+        """Seconds since each currency's price was fetched (inf if never)."""
+        now = time.monotonic()
+        return {code: now - self._fetched_at.get(code, -math.inf) for code in CURRENCIES}
+
+    def _body(self, ages: Dict[str, float]) -> dict:
+        """Prices too old to use are sent as 0; ``stale`` if any isn't fresh."""
+        body = {}
+        for code, key in CURRENCIES.items():
+            age = ages.get(code, math.inf)
+            body[key] = self._prices.get(code, 0) if age < settings.price_cache_max_stale else 0
+        body["stale"] = not ages or any(age >= settings.price_cache_ttl for age in ages.values())
+        return body
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._do_refresh())
+        return self._refresh
+
+    async def _do_refresh(self) -> None:
+        self.refreshes += 1
+        codes = list(CURRENCIES)
+        results = await asyncio.gather(
+            *(nowpayments.get_estimated_price(QUOTE_USD, "usd", code) for code in codes),
+            return_exceptions=True,
+        )
+        for code, result in zip(codes, results):
+            if isinstance(result, BaseException):
+                self.errors += 1
+                print(f"Error fetching NOWPayments estimate for {code}: {result}")
+            elif result > 0:
+                self._prices[code] = round(QUOTE_USD / result, 2)
+                self._fetched_at[code] = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "age_s": {
+                code: round(age, 1) if math.isfinite(age) else None
+                for code, age in self._ages().items()
+            },
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
+
+
+price_quotes = PriceQuotes()
@@ -0,0 +1,114 @@
+"""Exact-match response cache for chat requests.
+
+With RESPONSE_CACHE_ENABLED=1, a finished ``/chat/stream`` reply is stored
+under a hash of everything that determines it: the model, the messages as
+sent to Ollama and the generation options. An identical request is then
+answered from the cache without touching a GPU.
+
+- Entries live in Redis (``void:rc:{hash}``) with RESPONSE_CACHE_TTL, so all
+  workers share them; a small in-process LRU sits in front.
+- Replies larger than RESPONSE_CACHE_MAX_BYTES are not stored.
+- Identical requests that arrive while the first one is still generating
+  share its generation (see ``services/broadcast.py``).
+
+Sampling makes replies vary, so this is only worth enabling for
+deterministic traffic (canned prompts, FAQ bots, fixed seeds). Clients can
+skip it per request with ``"cache": false``.
+"""
+
+import hashlib
+import json
+from typing import NamedTuple, Optional
+
+from redis.exceptions import RedisError
+
+from config.settings import settings
+from state.redis_state import get_redis
+from utils.cache import MISSING, TTLCache
+from utils.ndjson import dumps, loads
+
+KEY = "void:rc:{}"
+
+
+class CachedResponse(NamedTuple):
+    text: bytes
+    done: dict  # Ollama's final stats object
+
+
+def cache_key(payload: dict) -> str:
+    """Canonical hash of the parts of an Ollama payload that shape the reply."""
+    canonical = json.dumps(
+        {
+            "model": payload.get("model", ""),
+            "messages": payload.get("messages", []),
+            "options": payload.get("options") or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Redis-backed reply cache with an in-process LRU in front."""
+
+    def __init__(self):
+        self._local = TTLCache(settings.response_cache_local_size, settings.response_cache_ttl)
+        self.redis_hits = 0
+        self.stored = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.response_cache_enabled
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        hit = self._local.get(key)
+        if hit is not MISSING:
+            return hit
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            raw = await redis.get(KEY.format(key))
+        except RedisError:
+            self.errors += 1
+            return None
+        if raw is None:
+            return None
+        entry = loads(raw)
+        hit = CachedResponse(entry["text"].encode("utf-8"), entry["done"])
+        self.redis_hits += 1
+        self._local.set(key, hit)
+        return hit
+
+    async def store(self, key: str, reply: CachedResponse) -> None:
+        """Cache a finished reply unless it is too large."""
+        if len(reply.text) > settings.response_cache_max_bytes:
+            return
+        self._local.set(key, reply)
+        self.stored += 1
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.set(
+                KEY.format(key),
+                dumps({"text": reply.text.decode("utf-8"), "done": reply.done}),
+                ex=int(settings.response_cache_ttl),
+            )
+        except RedisError:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "local": self._local.stats(),
+            "redis_hits": self.redis_hits,
+            "stored": self.stored,
+            "errors": self.errors,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,180 @@
+"""Model warm-up — load models before the first user request needs them.
+
+When a model is not in memory, the next request for it waits several
+seconds while Ollama loads it. This module avoids that:
+
+- At startup, WARMUP_MODELS (default: OLLAMA_MODEL) are loaded on every
+  healthy backend that has them installed, in the background.
+- A scheduler runs every WARMUP_INTERVAL seconds. Models requested at least
+  WARMUP_MIN_REQUESTS times in the last WARMUP_WINDOW seconds count as hot,
+  as do WARMUP_MODELS. A hot model's keep_alive is renewed on the backends
+  where it is loaded; if it is loaded nowhere, it is loaded on the least
+  busy backend.
+- ``POST /warmup`` (admin) triggers a warm-up on demand.
+
+A warm-up is an empty ``/api/generate`` call, which only loads the model.
+Cold starts are measured from the ``load_duration`` Ollama reports on
+every chat (see ``observe``) and show up in ``/metrics``.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config.settings import settings
+from services.ollama import model_request_settings, upstream
+from services.ollama_pool import OllamaNode, model_key, ollama_pool
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Warmup:
+    """Preloads models and keeps frequently used ones in memory."""
+
+    def __init__(self):
+        self._requests: Dict[str, Deque[float]] = {}
+        self._cold_ms: Deque[float] = deque(maxlen=256)
+        self._task: Optional[asyncio.Task] = None
+        self._startup: Optional[asyncio.Task] = None
+        self.chats = 0
+        self.cold_starts = 0
+        self.warmups = 0
+        self.warmup_errors = 0
+        self.last_run: Optional[float] = None
+
+    def configured_models(self) -> List[str]:
+        return settings.warmup_models or ([settings.ollama_model] if settings.ollama_model else [])
+
+    # --- Request tracking (called for every chat) ---
+
+    def record(self, model: str) -> None:
+        """Count a chat request for ``model`` towards its hotness."""
+        if not model:
+            return
+        now = time.monotonic()
+        times = self._requests.setdefault(model_key(model), deque())
+        times.append(now)
+        while times and times[0] < now - settings.warmup_window:
+            times.popleft()
+
+    def observe(self, done: dict) -> None:
+        """Record whether a finished chat had to load its model first."""
+        self.chats += 1
+        load_ms = int(done.get("load_duration") or 0) / 1e6
+        if load_ms >= settings.warmup_cold_ms:
+            self.cold_starts += 1
+            self._cold_ms.append(load_ms)
+
+    def hot_models(self) -> List[str]:
+        cutoff = time.monotonic() - settings.warmup_window
+        hot = {model_key(m) for m in self.configured_models()}
+        for model, times in list(self._requests.items()):
+            while times and times[0] < cutoff:
+                times.popleft()
+            if not times:
+                del self._requests[model]
+            elif len(times) >= settings.warmup_min_requests:
+                hot.add(model)
+        return sorted(hot)
+
+    # --- Warm-up calls ---
+
+    async def warm(self, model: str, node: OllamaNode) -> dict:
+        """Load ``model`` on ``node`` (or renew its keep_alive there)."""
+        url = f"{node.url}/api/generate"
+        started = time.monotonic()
+        try:
+            async with upstream(url) as client:
+                res = await client.post(url, json={
+                    "model": model,
+                    "keep_alive": model_request_settings(model)["keep_alive"],
+                })
+                res.raise_for_status()
+                done = res.json()
+        except Exception as e:
+            self.warmup_errors += 1
+            print(f"Warmup: {model} on {node.url} failed: {e!r}")
+            return {"model": model, "backend": node.url, "ok": False, "error": str(e)}
+        self.warmups += 1
+        node.loaded.add(model_key(model))
+        return {
+            "model": model,
+            "backend": node.url,
+            "ok": True,
+            "load_ms": round(int(done.get("load_duration") or 0) / 1e6, 1),
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+
+    def _installed_on(self, model: str) -> List[OllamaNode]:
+        key = model_key(model)
+        healthy = [n for n in ollama_pool.nodes if n.healthy]
+        # Before the first probe the model lists are empty; try every node then.
+        return [n for n in healthy if key in n.models] or [n for n in healthy if not n.models]
+
+    async def preload(self, models: List[str]) -> List[dict]:
+        """Load each model on every healthy backend that has it installed."""
+        jobs = [self.warm(m, n) for m in models for n in self._installed_on(m)]
+        return list(await asyncio.gather(*jobs))
+
+    async def keep_warm(self) -> List[dict]:
+        """One scheduler pass over the hot models."""
+        jobs = []
+        for model in self.hot_models():
+            nodes = self._installed_on(model)
+            loaded = [n for n in nodes if model in n.loaded]
+            if loaded:
+                jobs.extend(self.warm(model, n) for n in loaded)
+            else:
+                node = ollama_pool.pick(model)
+                if node is not None and node in nodes:
+                    jobs.append(self.warm(model, node))
+        self.last_run = time.time()
+        return list(await asyncio.gather(*jobs))
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.warmup_interval)
+            try:
+                await self.keep_warm()
+            except Exception as e:
+                print(f"Warmup: scheduler error: {e}")
+
+    async def start(self) -> None:
+        if settings.warmup_on_start and self.configured_models():
+            # In the background: loading can take a while, startup should not wait.
+            self._startup = asyncio.create_task(self.preload(self.configured_models()))
+        if settings.warmup_interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        for task in (self._startup, self._task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._startup = self._task = None
+
+    def stats(self) -> dict:
+        cold = list(self._cold_ms)
+        return {
+            "hot_models": self.hot_models(),
+            "chats": self.chats,
+            "cold_starts": self.cold_starts,
+            "cold_start_rate": round(self.cold_starts / self.chats, 4) if self.chats else 0.0,
+            "cold_start_ms_p50": round(_percentile(cold, 0.5), 1),
+            "cold_start_ms_p95": round(_percentile(cold, 0.95), 1),
+            "warmups": self.warmups,
+            "warmup_errors": self.warmup_errors,
+            "last_run": self.last_run,
+        }
+
+
+warmup = Warmup()
@@ -0,0 +1,386 @@
+"""Durable inbox for payment webhooks.
+
+The webhook route only verifies the signature, appends the raw event to the
+``webhook_inbox`` table and answers 200, so gateways never time out and
+resend while a payment rush is being processed. Background workers
+(WEBHOOK_WORKERS) then apply the events. NOWPayments and BTCPay events go
+through the same pipeline; only parsing differs.
+
+- An event is stored once per (gateway, payment, status); gateway retries
+  of the same IPN are ignored at insert time.
+- Workers claim pending rows in one transaction, so several workers (and
+  several app processes sharing the database) never apply a row twice. A
+  claim older than WEBHOOK_CLAIM_TIMEOUT is considered abandoned by a
+  crashed worker and is picked up again.
+- A claimed batch is applied in one transaction: invoices, pro tokens and
+  the rows' new status are committed together, so a replayed backlog of
+  thousands of events costs one commit per WEBHOOK_BATCH_SIZE events. The
+  ``invoices.order_id`` check makes a replay a no-op, so a row can safely
+  be applied again after a crash.
+- Only the token's hash is kept in ``pro_tokens``, so a row that issued a
+  token stays ``issued`` with the plaintext token until the token is stored
+  in Redis for the frontend; then it becomes ``done`` and the token is
+  cleared. A crash or Redis outage between the commit and the hand-over
+  only delays delivery: ``issued`` rows are handed over again every
+  WEBHOOK_CLAIM_TIMEOUT seconds until it succeeds.
+- Failed rows are retried with exponential backoff, up to
+  WEBHOOK_MAX_ATTEMPTS, then left as ``failed`` for inspection.
+"""
+
+import asyncio
+import json
+import secrets
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from config.settings import settings
+from db.sqlite import run_db
+from services.btcpay import btcpay
+from services.credits import invalidate_token
+from services.payment_events import publish_tokens
+from utils.crypto_utils import hash_token
+
+
+class PaidOrder(NamedTuple):
+    order_id: str
+    payment_id: str
+    credits: int
+    note: str  # for the log line
+
+
+def extract_credits_from_description(description: str) -> int:
+    """Extract credits count from order description.
+
+    Format: "VOID AI Starter plan — 500 credits"
+    """
+    try:
+        # Find the number before "credits"
+        parts = description.split("credits")[0].strip().split()
+        return int(parts[-1])
+    except Exception:
+        return 0
+
+
+def nowpayments_event_key(event: dict) -> Optional[str]:
+    """Inbox dedup key for a NOWPayments IPN, or None if it needs no processing."""
+    if event.get("payment_status") != "finished":
+        return None
+    return f"nowpayments:{event.get('payment_id')}:{event.get('order_id', '')}"
+
+
+def btcpay_event_key(event: dict) -> Optional[str]:
+    """Inbox dedup key for a BTCPay webhook, or None if it needs no processing."""
+    if event.get("type") != "InvoiceSettled" or not event.get("invoiceId"):
+        return None
+    return f"btcpay:{event['invoiceId']}"
+
+
+def credits_for_order(order_id: str) -> int:
+    """Credits of the plan encoded in an order ID ("void_{plan_id}_{ts}_{hex}")."""
+    if not order_id.startswith("void_"):
+        return 0
+    plan_id = order_id[len("void_"):].rsplit("_", 2)[0]
+    plan = next((p for p in settings.plans if p["id"] == plan_id), None)
+    return plan["credits"] if plan else 0
+
+
+async def _parse_nowpayments(event: dict) -> Optional[PaidOrder]:
+    credits = extract_credits_from_description(event.get("order_description", ""))
+    if credits <= 0:
+        print(f"Webhook: could not extract credits from description: {event.get('order_description', '')}")
+        return None
+    return PaidOrder(
+        order_id=event.get("order_id", ""),
+        payment_id=str(event.get("payment_id")),
+        credits=credits,
+        note=f"{event.get('pay_amount', 0)} {event.get('pay_currency', '')}",
+    )
+
+
+async def _parse_btcpay(event: dict) -> Optional[PaidOrder]:
+    metadata = event.get("metadata")
+    if not metadata:
+        # Older BTCPay versions don't include the invoice metadata in webhooks.
+        metadata = (await btcpay.get_invoice(event["invoiceId"])).get("metadata") or {}
+    order_id = metadata.get("orderId", "")
+    credits = credits_for_order(order_id) or extract_credits_from_description(metadata.get("itemDesc", ""))
+    if credits <= 0:
+        print(f"Webhook: could not find credits for BTCPay invoice {event['invoiceId']} ({order_id})")
+        return None
+    return PaidOrder(
+        order_id=order_id,
+        payment_id=event["invoiceId"],
+        credits=credits,
+        note="BTCPay invoice settled",
+    )
+
+
+# gateway -> parser of its stored event into the order to fulfil
+PARSERS: Dict[str, Callable[[dict], Awaitable[Optional[PaidOrder]]]] = {
+    "nowpayments": _parse_nowpayments,
+    "btcpay": _parse_btcpay,
+}
+
+
+# --- DB functions (run on the DB thread pool) ---
+
+
+def _insert_event(conn: sqlite3.Connection, gateway: str, event_key: str, body: str) -> bool:
+    """Append an event. False if the same event is already in the inbox."""
+    now = int(time.time())
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO webhook_inbox(gateway, event_key, body, received_at, available_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (gateway, event_key, body, now, now),
+    )
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def _claim(conn: sqlite3.Connection, limit: int) -> List[sqlite3.Row]:
+    """Mark up to ``limit`` due rows as processing and return them."""
+    now = int(time.time())
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(
+        "SELECT id, gateway, body, attempts FROM webhook_inbox "
+        "WHERE (status = 'pending' AND available_at <= ?) "
+        "   OR (status = 'processing' AND claimed_at < ?) "
+        "ORDER BY id LIMIT ?",
+        (now, now - settings.webhook_claim_timeout, limit),
+    ).fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE webhook_inbox SET status = 'processing', claimed_at = ? WHERE id = ?",
+            [(now, r["id"]) for r in rows],
+        )
+    conn.commit()
+    return rows
+
+
+def _issue(conn: sqlite3.Connection, paid: PaidOrder, token_hash: str) -> bool:
+    """Record a paid invoice and its pro token (no commit).
+
+    Returns False if this order was already fulfilled.
+    """
+    existing = conn.execute(
+        "SELECT 1 FROM invoices WHERE order_id = ?", (paid.order_id,)
+    ).fetchone()
+    if existing:
+        return False
+    now = int(time.time())
+    conn.execute(
+        "INSERT INTO invoices(invoice_id, credits, status, created_at, order_id) "
+        "VALUES (?, ?, 'paid', ?, ?)",
+        (paid.payment_id, paid.credits, now, paid.order_id),
+    )
+    conn.execute(
+        "INSERT INTO pro_tokens(token_hash, credits_left, created_at) VALUES (?, ?, ?)",
+        (token_hash, paid.credits, now),
+    )
+    return True
+
+
+def _apply_batch(
+    conn: sqlite3.Connection, items: List[Tuple[int, Optional[PaidOrder], str]]
+) -> List[bool]:
+    """Fulfil (row id, order, token) items in one commit.
+
+    Rows that issued a token become ``issued`` and keep it until it is
+    delivered (leased to this worker for WEBHOOK_CLAIM_TIMEOUT); the others
+    become ``done``. Returns, per item, whether a token was issued.
+    """
+    lease_until = int(time.time()) + settings.webhook_claim_timeout
+    issued = []
+    for row_id, paid, token in items:
+        new = paid is not None and _issue(conn, paid, hash_token(token))
+        if new:
+            conn.execute(
+                "UPDATE webhook_inbox SET status = 'issued', order_id = ?, token = ?, available_at = ? "
+                "WHERE id = ?",
+                (paid.order_id, token, lease_until, row_id),
+            )
+        else:
+            conn.execute("UPDATE webhook_inbox SET status = 'done' WHERE id = ?", (row_id,))
+        issued.append(new)
+    conn.commit()
+    return issued
+
+
+def _claim_deliveries(conn: sqlite3.Connection, limit: int) -> List[sqlite3.Row]:
+    """Lease up to ``limit`` issued rows whose token still has to reach Redis."""
+    now = int(time.time())
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(
+        "SELECT id, order_id, token FROM webhook_inbox "
+        "WHERE status = 'issued' AND available_at <= ? ORDER BY id LIMIT ?",
+        (now, limit),
+    ).fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE webhook_inbox SET available_at = ? WHERE id = ?",
+            [(now + settings.webhook_claim_timeout, r["id"]) for r in rows],
+        )
+    conn.commit()
+    return rows
+
+
+def _delivered(conn: sqlite3.Connection, row_ids: List[int]) -> None:
+    conn.executemany(
+        "UPDATE webhook_inbox SET status = 'done', token = NULL WHERE id = ?",
+        [(row_id,) for row_id in row_ids],
+    )
+    conn.commit()
+
+
+def _fail(conn: sqlite3.Connection, row_id: int, attempts: int, error: str) -> None:
+    status = "failed" if attempts >= settings.webhook_max_attempts else "pending"
+    conn.execute(
+        "UPDATE webhook_inbox SET status = ?, attempts = ?, last_error = ?, available_at = ? WHERE id = ?",
+        (status, attempts, error[:500], int(time.time()) + 2 ** attempts, row_id),
+    )
+    conn.commit()
+
+
+def _prune(conn: sqlite3.Connection) -> int:
+    cutoff = int(time.time()) - settings.webhook_retention_days * 86400
+    cur = conn.execute(
+        "DELETE FROM webhook_inbox WHERE status = 'done' AND received_at < ?", (cutoff,)
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def _counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    rows = conn.execute("SELECT status, COUNT(*) FROM webhook_inbox GROUP BY status").fetchall()
+    return {status: n for status, n in rows}
+
+
+class WebhookInbox:
+    """Accepts webhook events durably and applies them in the background."""
+
+    def __init__(self):
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.accepted = 0
+        self.duplicates = 0
+        self.applied = 0
+        self.issued = 0
+        self.delivered = 0
+        self.delivery_failures = 0
+        self.failures = 0
+
+    async def accept(self, gateway: str, event_key: str, body: str) -> bool:
+        """Store a verified event for processing. False if it was a duplicate."""
+        if await run_db(_insert_event, gateway, event_key, body):
+            self.accepted += 1
+            self._wake.set()
+            return True
+        self.duplicates += 1
+        return False
+
+    async def process_once(self) -> int:
+        """Hand over undelivered tokens, then claim and apply one batch.
+
+        Returns the number of rows handled.
+        """
+        undelivered = await run_db(_claim_deliveries, settings.webhook_batch_size)
+        if undelivered:
+            await self._deliver({r["id"]: (r["order_id"], r["token"]) for r in undelivered})
+
+        rows = await run_db(_claim, settings.webhook_batch_size)
+        if not rows:
+            return len(undelivered)
+        items = []  # (row id, order, token)
+        applied_rows = []
+        for row in rows:
+            try:
+                paid = await PARSERS[row["gateway"]](json.loads(row["body"]))
+            except Exception as e:
+                await self._fail(row, e)
+                continue
+            items.append((row["id"], paid, "void_" + secrets.token_urlsafe(32)))
+            applied_rows.append(row)
+        if not items:
+            return len(rows)
+
+        try:
+            issued = await run_db(_apply_batch, items)
+        except Exception as e:
+            for row in applied_rows:
+                await self._fail(row, e)
+            return len(rows)
+
+        self.applied += len(items)
+        new_tokens = {}
+        for (row_id, paid, token), new in zip(items, issued):
+            if not new:
+                continue  # nothing to do, or already fulfilled
+            self.issued += 1
+            print(f"Payment confirmed: {paid.order_id} — {paid.note} "
+                  f"(payment_id={paid.payment_id}, credits={paid.credits})")
+            invalidate_token(hash_token(token))
+            new_tokens[row_id] = (paid.order_id, token)
+        await self._deliver(new_tokens)
+        return len(rows)
+
+    async def _deliver(self, tokens: Dict[int, Tuple[str, str]]) -> None:
+        """Store tokens (row id -> (order ID, token)) in Redis, then clear them."""
+        if not tokens:
+            return
+        if await publish_tokens(dict(tokens.values())):
+            await run_db(_delivered, list(tokens))
+            self.delivered += len(tokens)
+        else:
+            self.delivery_failures += 1
+
+    async def _fail(self, row: sqlite3.Row, error: Exception) -> None:
+        self.failures += 1
+        print(f"Webhook inbox: event {row['id']} failed: {error!r}")
+        await run_db(_fail, row["id"], row["attempts"] + 1, repr(error))
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                if await self.process_once():
+                    continue  # there may be more
+            except Exception as e:
+                print(f"Webhook inbox worker error: {e}")
+            # Wake up on new events, or poll for retries and other processes' rows.
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.webhook_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def start(self) -> None:
+        """Prune old rows and start the workers (startup, payment mode only)."""
+        if not settings.payments_enabled:
+            return
+        pruned = await run_db(_prune)
+        if pruned:
+            print(f"Webhook inbox: pruned {pruned} old events")
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(max(1, settings.webhook_workers))
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self) -> dict:
+        return {
+            "rows": await run_db(_counts),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "applied": self.applied,
+            "tokens_issued": self.issued,
+            "tokens_delivered": self.delivered,
+            "delivery_failures": self.delivery_failures,
+            "failures": self.failures,
+        }
+
+
+webhook_inbox = WebhookInbox()
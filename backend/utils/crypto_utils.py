@@ -2,6 +2,7 @@
 
 import hashlib
 import hmac
+from typing import Dict
 
 from config.settings import settings
 
@@ -21,6 +22,45 @@ def secure_hash(data: str) -> str:
     ).hexdigest()
 
 
+class WindowKeyedHasher:
+    """Rate-limit key hashing with a salt that rotates every window.
+
+    The key for ``value`` in window ``w`` is
+    ``SHA256(SHA256(SERVER_SALT:w).hexdigest() + ":" + value)``, so a leaked
+    SERVER_SALT doesn't let anyone brute-force keys from windows whose derived
+    salt is gone. The derived salt only changes once per window, so it is
+    computed once and kept as a pre-fed SHA256 object; each call then copies
+    that state and hashes just the value. Only the last two windows are kept.
+    """
+
+    __slots__ = ("_prefixes",)
+
+    def __init__(self):
+        self._prefixes: Dict[int, "hashlib._Hash"] = {}
+
+    def _prefix(self, window_id: int) -> "hashlib._Hash":
+        prefix = self._prefixes.get(window_id)
+        if prefix is None:
+            window_salt = hashlib.sha256(
+                f"{settings.server_salt}:{window_id}".encode()
+            ).hexdigest()
+            prefix = hashlib.sha256(window_salt.encode() + b":")
+            # Keep this window and its predecessor; older salts are dropped.
+            for old in [w for w in self._prefixes if w < window_id - 1]:
+                del self._prefixes[old]
+            self._prefixes[window_id] = prefix
+        return prefix
+
+    def hash(self, value: bytes, window_id: int) -> str:
+        """Hex digest of ``value`` (already encoded) under ``window_id``'s salt."""
+        h = self._prefix(window_id).copy()
+        h.update(value)
+        return h.hexdigest()
+
+
+window_hasher = WindowKeyedHasher()
+
+
 def verify_btcpay_sig(raw_body: bytes, btcpay_sig: str, secret: str) -> bool:
     """Verify BTCPay Server webhook signature."""
     if not btcpay_sig or not btcpay_sig.startswith("sha256="):
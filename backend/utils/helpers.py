@@ -1,6 +1,7 @@
 """Request helper utilities."""
 
-from typing import List
+import unicodedata
+from typing import Iterable, List
 
 from fastapi import Request
 
@@ -20,11 +21,34 @@ def get_raw_ip(request: Request) -> str:
     )
 
 
+def canonical_content(text: str) -> str:
+    """Normalize message text so the same history always serializes the same.
+
+    Clients resend the whole conversation every turn, and small differences
+    (CRLF vs LF, composed vs decomposed accents, a trailing newline) change
+    the prompt Ollama sees and defeat its KV-cache prefix reuse. Text is
+    converted to NFC with LF line endings, and trailing whitespace is
+    dropped. Leading whitespace is kept: it can be meaningful, e.g. the
+    indentation of a pasted code block.
+    """
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if not text.isascii() and not unicodedata.is_normalized("NFC", text):
+        text = unicodedata.normalize("NFC", text)
+    return text.rstrip()
+
+
+def canonical_messages(messages: Iterable) -> List[dict]:
+    """Message dicts with a fixed key order and canonical content."""
+    return [{"role": m.role, "content": canonical_content(m.content)} for m in messages]
+
+
 def build_messages(body: ChatIn) -> List[dict]:
     """Build a list of message dicts from the request body.
 
     If `messages` is provided, use those. Otherwise wrap `message` as a single user message.
+    Content is canonicalized (see ``canonical_content``).
     """
     if body.messages and len(body.messages) > 0:
-        return [m.model_dump() for m in body.messages]
-    return [{"role": "user", "content": body.message or ""}]
+        return canonical_messages(body.messages)
+    return [{"role": "user", "content": canonical_content(body.message or "")}]
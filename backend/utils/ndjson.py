@@ -0,0 +1,124 @@
+"""Byte-level NDJSON parsing for Ollama chat streams.
+
+Ollama streams one JSON object per line. The chat route only needs two
+fields, ``message.content`` and ``done``, and forwards the content as UTF-8
+bytes. This module works on the raw response bytes and skips the str
+round-trip:
+
+- ``LineSplitter`` cuts a byte stream into lines, keeping a partial line
+  across chunk boundaries;
+- ``parse_chat_line`` extracts ``(content, done)`` from one line with the
+  fastest JSON backend installed: msgspec, then orjson, then the stdlib;
+- ``loads`` / ``dumps`` (bytes in, bytes out) use the same backend.
+
+With msgspec, lines are decoded straight into a two-field struct, so the
+other fields (timestamps, model name, final stats) are skipped instead of
+being built into a dict. Neither msgspec nor orjson is required; they are
+picked up when installed. ``python -m benchmarks.bench_ndjson`` compares them.
+"""
+
+import importlib.util
+import json
+from typing import Callable, List, Optional, Tuple
+
+ChatLine = Tuple[bytes, bool]
+
+BACKENDS = [
+    name for name in ("msgspec", "orjson")
+    if importlib.util.find_spec(name) is not None
+] + ["json"]
+
+
+class LineSplitter:
+    """Split a byte stream into lines; a partial last line waits for more data."""
+
+    __slots__ = ("_rest",)
+
+    def __init__(self):
+        self._rest = b""
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Return the complete lines in ``data`` (plus any carried-over part)."""
+        if self._rest:
+            data = self._rest + data
+        lines = data.split(b"\n")
+        self._rest = lines.pop()
+        return lines
+
+    def flush(self) -> bytes:
+        """Return whatever is left once the stream has ended."""
+        rest, self._rest = self._rest, b""
+        return rest
+
+
+def _msgspec_parser() -> Callable[[bytes], Optional[ChatLine]]:
+    import msgspec
+
+    class _Message(msgspec.Struct):
+        content: Optional[str] = None
+
+    class _Line(msgspec.Struct):
+        message: Optional[_Message] = None
+        done: bool = False
+
+    decode = msgspec.json.Decoder(_Line).decode
+    error = msgspec.DecodeError
+
+    def parse(line: bytes) -> Optional[ChatLine]:
+        try:
+            obj = decode(line)
+        except error:
+            return None
+        message = obj.message
+        if message is None or not message.content:
+            return b"", obj.done
+        return message.content.encode("utf-8"), obj.done
+
+    return parse
+
+
+def _dict_parser(loads, error) -> Callable[[bytes], Optional[ChatLine]]:
+    def parse(line: bytes) -> Optional[ChatLine]:
+        try:
+            obj = loads(line)
+        except error:
+            return None
+        if not isinstance(obj, dict):
+            return None
+        message = obj.get("message")
+        content = message.get("content") if isinstance(message, dict) else None
+        chunk = content.encode("utf-8") if isinstance(content, str) else b""
+        return chunk, bool(obj.get("done"))
+
+    return parse
+
+
+def make_chat_line_parser(backend: str = BACKENDS[0]) -> Callable[[bytes], Optional[ChatLine]]:
+    """Build a parser returning ``(content_utf8, done)``, or None for a bad line."""
+    if backend == "msgspec":
+        return _msgspec_parser()
+    if backend == "orjson":
+        import orjson
+
+        return _dict_parser(orjson.loads, orjson.JSONDecodeError)
+    return _dict_parser(json.loads, ValueError)
+
+
+parse_chat_line = make_chat_line_parser()
+
+# Whole-object JSON for the rarer cases (Ollama's final stats, SSE frames).
+if BACKENDS[0] == "msgspec":
+    import msgspec
+
+    loads = msgspec.json.decode
+    dumps = msgspec.json.encode
+elif BACKENDS[0] == "orjson":
+    import orjson
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+else:
+    loads = json.loads
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,37 @@
+"""Redis Lua script helper — SCRIPT LOAD once, then EVALSHA.
+
+Sending the full script text with EVAL on every request costs bandwidth and a
+script-cache lookup by body. ``LuaScript`` sends only the SHA1 and reloads the
+script transparently if Redis answers NOSCRIPT (e.g. after a restart or
+SCRIPT FLUSH).
+"""
+
+import hashlib
+from typing import Any, List, Sequence
+
+from redis.asyncio import Redis
+from redis.exceptions import NoScriptError
+
+_registry: List["LuaScript"] = []
+
+
+class LuaScript:
+    """A Lua script called by SHA1."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        _registry.append(self)
+
+    async def __call__(self, redis: Redis, keys: Sequence[str], args: Sequence[Any] = ()) -> Any:
+        try:
+            return await redis.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await redis.script_load(self.source)
+            return await redis.evalsha(self.sha, len(keys), *keys, *args)
+
+
+async def load_scripts(redis: Redis) -> None:
+    """SCRIPT LOAD every registered script (called once at startup)."""
+    for script in _registry:
+        await redis.script_load(script.source)
@@ -0,0 +1,98 @@
+"""Helpers for streaming responses."""
+
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+
+from utils.ndjson import dumps
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[bytes], max_bytes: int, max_delay: float
+) -> AsyncIterator[bytes]:
+    """Merge small chunks from ``source`` into fewer, larger writes.
+
+    The first chunk is passed through at once, so time to first token is
+    unchanged. After that, chunks are buffered until ``max_bytes`` have
+    piled up or ``max_delay`` seconds have passed since the oldest buffered
+    chunk arrived, whichever comes first. Whatever is left is flushed as
+    soon as ``source`` ends. With ``max_delay <= 0`` there is no waiting:
+    chunks that arrive while the previous write is still in progress are
+    merged. With ``max_bytes <= 1`` as well, chunks are passed through as-is.
+
+    ``source`` is consumed by a background task so the time budget holds
+    even while no new chunk arrives. If the consumer falls behind by more
+    than a few flushes' worth, the task stops reading until it catches up.
+    """
+    if max_bytes <= 1 and max_delay <= 0:
+        async for chunk in source:
+            yield chunk
+        return
+    if max_bytes <= 1:
+        max_bytes = 1 << 20  # time budget only
+    high_water = max_bytes * 4
+
+    loop = asyncio.get_running_loop()
+    buf: List[bytes] = []
+    size = 0
+    finished = False
+    timer: Optional[asyncio.TimerHandle] = None
+    ready = asyncio.Event()  # the consumer should flush now
+    room = asyncio.Event()  # the producer may keep reading
+    room.set()
+
+    async def produce() -> None:
+        nonlocal size, timer, finished
+        first = True
+        try:
+            async for chunk in source:
+                if not chunk:
+                    continue
+                buf.append(chunk)
+                size += len(chunk)
+                if first or size >= max_bytes or max_delay <= 0:
+                    first = False
+                    ready.set()
+                elif timer is None:
+                    timer = loop.call_later(max_delay, ready.set)
+                if size >= high_water:
+                    room.clear()
+                    await room.wait()
+        finally:
+            finished = True
+            ready.set()
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            if not finished:
+                await ready.wait()
+            ready.clear()
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if buf:
+                data = b"".join(buf)
+                buf.clear()
+                size = 0
+                room.set()
+                yield data
+            elif finished:
+                break
+        await task  # re-raise upstream errors
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> bytes:
+    """Encode one Server-Sent Events frame. Non-bytes ``data`` is sent as JSON."""
+    payload = data if isinstance(data, bytes) else dumps(data)
+    if event is None:
+        return b"data: " + payload + b"\n\n"
+    return b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
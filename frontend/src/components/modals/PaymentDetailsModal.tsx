@@ -65,14 +65,20 @@ export default function PaymentDetailsModal({
   const [paymentUrl, setPaymentUrl] = useState("");
   const [orderId, setOrderId] = useState("");
 
-  // Polling
+  // Completion: pushed over SSE, polling as a fallback
   const pollRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  const eventsRef = useRef<EventSource | null>(null);
+
+  function stopWatching() {
+    if (pollRef.current) clearInterval(pollRef.current);
+    pollRef.current = null;
+    eventsRef.current?.close();
+    eventsRef.current = null;
+  }
 
   useEffect(() => {
     createPayment();
-    return () => {
-      if (pollRef.current) clearInterval(pollRef.current);
-    };
+    return stopWatching;
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
@@ -114,9 +120,8 @@ export default function PaymentDetailsModal({
       setOrderId(data.order_id || "");
       setState("waiting");
 
-      // Start polling for payment completion
       if (data.order_id) {
-        pollRef.current = setInterval(() => checkPayment(data.order_id), 10000); // every 10s
+        watchPayment(data.order_id);
       }
     } catch (e: any) {
       setErrorMsg(e.message || "Failed to create payment");
@@ -126,6 +131,41 @@ export default function PaymentDetailsModal({
     }
   }
 
+  function completePayment(token: string | null) {
+    setState("done");
+    stopWatching();
+    if (token) {
+      onTokenReceived(token);
+    }
+  }
+
+  function startPolling(oid: string) {
+    if (pollRef.current) return;
+    pollRef.current = setInterval(() => checkPayment(oid), 10000); // every 10s
+  }
+
+  // Wait for the backend to push the token; poll if the stream is unavailable.
+  function watchPayment(oid: string) {
+    if (typeof EventSource === "undefined") {
+      startPolling(oid);
+      return;
+    }
+    const events = new EventSource(`${apiUrl}/pro/payment-events/${oid}`);
+    eventsRef.current = events;
+    events.addEventListener("completed", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      completePayment(data.token || null);
+    });
+    events.onerror = () => {
+      // CLOSED means the server refused the stream (e.g. 503); otherwise the
+      // browser reconnects by itself.
+      if (events.readyState === EventSource.CLOSED) {
+        eventsRef.current = null;
+        startPolling(oid);
+      }
+    };
+  }
+
   async function checkPayment(oid: string) {
     try {
       const res = await fetch(`${apiUrl}/pro/pending-payment/${oid}`);
@@ -133,12 +173,7 @@ export default function PaymentDetailsModal({
       const data = await res.json();
 
       if (data.status === "completed") {
-        setState("done");
-        if (pollRef.current) clearInterval(pollRef.current);
-
-        if (data.token) {
-          onTokenReceived(data.token);
-        }
+        completePayment(data.token || null);
       }
     } catch {
       // ignore polling errors